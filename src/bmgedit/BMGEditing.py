@@ -2,7 +2,12 @@
 
 """Heuristics for BMG editing."""
 
-import itertools
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 from tralda.datastructures import LCA
 from tralda.supertree.Build import best_pair_merge_first
@@ -30,6 +35,17 @@ class BMGEditor:
         
         self.L = [v for v in G.nodes()]
         
+        # colors and arcs as arrays for the objective functions
+        self._arrays = _GraphArrays(G, color_dict=self.color_dict)
+        
+        # pay the JIT compilation before any tree is built
+        if _count_relations_nb is not None:
+            _count_relations_nb(np.zeros(1, dtype=np.int32), 1,
+                                np.zeros(1, dtype=np.int32),
+                                np.zeros((1, 1), dtype=bool),
+                                np.zeros((1, 1), dtype=np.int64),
+                                np.ones(1, dtype=np.int64), False)
+        
         # informative triples
         if not binary:
             self.binarize = False
@@ -41,8 +57,13 @@ class BMGEditor:
             self.binarize = binarization_mode
             self.R = binary_explainable_triples(G, color_dict=self.color_dict)
             
-        # current tree built by one of the heuristics
+        # current tree built by one of the heuristics and its LCA structure
         self._tree = None
+        self._lca = None
+        
+        # tree built from the triples of R that are consistent with the
+        # current tree
+        self._consistent_tree = None
 
 
     def extract_consistent_triples(self):
@@ -50,24 +71,29 @@ class BMGEditor:
         if not self._tree:
             raise RuntimeError('no tree has been built yet')
         
-        lca = LCA(self._tree)
+        if self._lca is None:
+            self._lca = LCA(self._tree)
         
-        return lca.consistent_triples(self.R)
+        return self._lca.consistent_triples(self.R)
     
     
-    def build(self, method, objective='cost'):
+    def build(self, method, objective='cost', processes=1, threads=1):
         
         if objective == 'cost':
             minimize = True
             f_obj = unsatisfiability_cost
+            f_delta = unsatisfiability_cost_delta
         elif objective == 'gain':
             minimize = False
             f_obj = satisfied_relations
+            f_delta = satisfied_relations_delta
         else:
             raise ValueError('unknown mode for objective ' \
                              'function: {}'.format(objective))
 
         method = method.lower()
+        self._lca = None
+        self._consistent_tree = None
         
         if method == 'bpmf':
             self._tree = best_pair_merge_first(self.R,self.L,
@@ -80,8 +106,11 @@ class BMGEditor:
                            part_method=method,
                            obj_function=f_obj,
                            minimize=minimize,
-                           obj_function_args=(self.G,),
+                           obj_function_args=(self.G, self._arrays),
+                           obj_delta_function=f_delta,
                            weighted_mincut=True,
+                           processes=processes,
+                           threads=threads,
                           )
             self._tree = build.build_tree()
         else:
@@ -97,16 +126,20 @@ class BMGEditor:
             reconstruct_reconc_from_graph(self._tree, self.G)
             tree = self._tree
         else:
-            R_consistent = self.extract_consistent_triples()
-            build = Build2(R_consistent, self.L,
-                           allow_inconsistency=False,
-                           binarize=self.binarize,
-                          )
-            tree = build.build_tree()
-            reconstruct_reconc_from_graph(tree, self.G)
+            if self._consistent_tree is None:
+                R_consistent = self.extract_consistent_triples()
+                build = Build2(R_consistent, self.L,
+                               allow_inconsistency=False,
+                               binarize=self.binarize,
+                              )
+                self._consistent_tree = build.build_tree()
+                reconstruct_reconc_from_graph(self._consistent_tree, self.G)
+            tree = self._consistent_tree
 
             if update_tree:
                 self._tree= tree
+                self._lca = None
+                self._consistent_tree = None
 
         if supply_inner_vertex_count:
             return bmg_from_tree(tree), sum(1 for _ in tree.inner_nodes())
@@ -114,7 +147,386 @@ class BMGEditor:
             return bmg_from_tree(tree)
         
         
-def unsatisfiability_cost(partition, G):
+class _GraphArrays:
+    """Dense array representation of a vertex-colored digraph.
+    
+    The colors are interned to consecutive integers and the arcs are stored
+    in a boolean adjacency matrix w.r.t. the order of the nodes in `nodes`.
+    """
+    
+    __slots__ = ('nodes', 'index', 'color', 'ncolors', 'adj',
+                 'tot', 'color_arcs')
+    
+    def __init__(self, G, color_dict=None):
+        
+        self.nodes = [v for v in G.nodes()]
+        self.index = {v: i for i, v in enumerate(self.nodes)}
+        
+        # intern the colors via the color classes, i.e. the 'color'
+        # attributes are only read once if 'color_dict' is supplied
+        if color_dict is None:
+            color_dict = sort_by_colors(G)
+        
+        self.color = np.empty(len(self.nodes), dtype=np.int32)
+        for color_id, color_class in enumerate(color_dict.values()):
+            self.color[[self.index[v] for v in color_class]] = color_id
+        self.ncolors = len(color_dict)
+        
+        # filled row-wise from the successor dicts, i.e. one assignment per
+        # node instead of one per arc
+        self.adj = np.zeros((len(self.nodes), len(self.nodes)), dtype=bool)
+        for x, successors in G.adjacency():
+            self.adj[self.index[x], [self.index[y] for y in successors]] = True
+        
+        # sizes of the color classes and no. of arcs (index 0) and non-arcs
+        # (index 1) from each node into each other color class
+        self.tot = np.bincount(self.color, minlength=self.ncolors)
+        arcs = np.empty((len(self.nodes), self.ncolors), dtype=np.int64)
+        for c in range(self.ncolors):
+            arcs[:, c] = self.adj[:, self.color == c].sum(axis=1)
+        same = self.color[:, None] == np.arange(self.ncolors)[None, :]
+        self.color_arcs = np.stack((np.where(same, 0, arcs),
+                                    np.where(same, 0, self.tot - arcs)))
+    
+    
+    def partition_mask(self, partition):
+        """Map each node index to the index of its set in the partition.
+        
+        Nodes that are not contained in any of the sets are mapped to -1.
+        """
+        
+        mask = np.full(len(self.nodes), -1, dtype=np.int32)
+        k = 0
+        for k, V in enumerate(partition, start=1):
+            mask[[self.index[v] for v in V]] = k - 1
+        
+        return mask, k
+
+
+def _relation_masks(mask, k, color, adj, ncolors, satisfied=False):
+    """Generator for the three relation types of each set in a partition.
+    
+    Yields, for each of the `k` sets V_i, the node indices inside and outside
+    of V_i together with boolean matrices marking the pairs of type 1 and 2
+    (x in V_i, y not in V_i) and type 3 (x, y in V_i). The types correspond to
+    U1, U2, U3 if `satisfied` is False, and to S1, S2, S3 otherwise.
+    """
+    
+    for i in range(k):
+        
+        in_i = mask == i
+        inside, outside = np.flatnonzero(in_i), np.flatnonzero(~in_i)
+        
+        counts = np.bincount(color[inside], minlength=ncolors)
+        c_in, c_out = color[inside], color[outside]
+        has_c = (counts[c_out] > 0)[None, :]
+        only_one = (counts[c_in] == 1)[None, :]
+        
+        # rows of V_i are gathered once and then split into the columns
+        # outside and inside of V_i; complementing the arcs turns the
+        # unsatisfiable relations into the satisfied ones
+        rows = adj[inside] != satisfied
+        cross, inner = rows[:, outside], rows[:, inside]
+        
+        # pairs with the same color (incl. x = y) are skipped
+        cross_diff = c_in[:, None] != c_out[None, :]
+        inner_diff = c_in[:, None] != c_in[None, :]
+        
+        T1 = cross & has_c & cross_diff
+        T2 = ~cross & ~has_c & cross_diff
+        T3 = ~inner & only_one & inner_diff
+        
+        yield inside, outside, T1, T2, T3
+
+
+def _relations_from_color_sums(n, size, sum_A, inner, tot):
+    """Number of relations of type 1, 2, and 3 of a set V_i.
+    
+    For each color c, the pairs (x, y) with x in V_i and y of color c only
+    depend on the no. 'n[c]' of nodes of color c in V_i, the size of V_i,
+    the no. 'sum_A[c]' of (complemented) arcs from V_i into color c, the
+    no. 'inner[c]' of those arcs that end in V_i, and the size 'tot[c]' of
+    the color class. Leading dimensions are treated as independent sets.
+    """
+    
+    # nodes in the set of a different color than c
+    m_c = np.asarray(size)[..., None] - n
+    
+    return (np.where(n > 0, sum_A - inner, m_c * tot - sum_A) +
+            np.where(n == 1, m_c - inner, 0)).sum(axis=-1)
+
+
+def _count_relations_numpy(mask, k, color, adj, color_arcs, tot, satisfied):
+    """Count the relations of type 1, 2, and 3 via the color sums."""
+    
+    total = 0
+    
+    for i in range(k):
+        
+        inside = np.flatnonzero(mask == i)
+        c_in = color[inside]
+        
+        inner_arcs = ((adj[np.ix_(inside, inside)] != satisfied) &
+                      (c_in[:, None] != c_in[None, :]))
+        inner = np.bincount(c_in, weights=inner_arcs.sum(axis=0),
+                            minlength=len(tot)).astype(np.int64)
+        
+        total += int(_relations_from_color_sums(
+            np.bincount(c_in, minlength=len(tot)), len(inside),
+            color_arcs[inside].sum(axis=0), inner, tot))
+    
+    return total
+
+
+def _count_relations_loops(mask, k, color, adj, color_arcs, tot, satisfied):
+    """Count the relations of type 1, 2, and 3 in plain loops.
+    
+    Same semantics as '_count_relations_numpy'. Only the pairs inside of the
+    sets are visited, the pairs between a set and its complement are
+    accounted for via the (non-)arcs of each node into each color class.
+    Compiled with Numba if available.
+    """
+    
+    n = mask.shape[0]
+    ncolors = tot.shape[0]
+    
+    # members of the sets (counting sort by set index)
+    start = np.zeros(k + 1, dtype=np.int64)
+    for x in range(n):
+        if mask[x] >= 0:
+            start[mask[x] + 1] += 1
+    for i in range(k):
+        start[i + 1] += start[i]
+    members = np.empty(start[k], dtype=np.int64)
+    fill = start[:k].copy()
+    for x in range(n):
+        if mask[x] >= 0:
+            members[fill[mask[x]]] = x
+            fill[mask[x]] += 1
+    
+    counts = np.zeros(ncolors, dtype=np.int64)
+    sum_A = np.zeros(ncolors, dtype=np.int64)
+    inner = np.zeros(ncolors, dtype=np.int64)
+    total = 0
+    
+    for i in range(k):
+        
+        counts[:] = 0
+        sum_A[:] = 0
+        inner[:] = 0
+        
+        for a in range(start[i], start[i + 1]):
+            x = members[a]
+            counts[color[x]] += 1
+            for c in range(ncolors):
+                sum_A[c] += color_arcs[x, c]
+        
+        # arcs inside of the set, counted per color of the head
+        for b in range(start[i], start[i + 1]):
+            y = members[b]
+            c = color[y]
+            column = 0
+            for a in range(start[i], start[i + 1]):
+                x = members[a]
+                if adj[x, y] != satisfied and color[x] != c:
+                    column += 1
+            inner[c] += column
+        
+        size = start[i + 1] - start[i]
+        for c in range(ncolors):
+            m_c = size - counts[c]
+            if counts[c] > 0:
+                total += sum_A[c] - inner[c]
+            else:
+                total += m_c * tot[c] - sum_A[c]
+            if counts[c] == 1:
+                total += m_c - inner[c]
+    
+    return total
+
+
+if njit is not None:
+    _count_relations_nb = njit(cache=True)(_count_relations_loops)
+else:
+    _count_relations_nb = None
+
+
+def _count_relations(partition, G, arrays, satisfied):
+    
+    if arrays is None:
+        arrays = _GraphArrays(G)
+    mask, k = arrays.partition_mask(partition)
+    
+    count = (_count_relations_nb if _count_relations_nb is not None else
+             _count_relations_numpy)
+    
+    return int(count(mask, k, arrays.color, arrays.adj,
+                     arrays.color_arcs[int(satisfied)], arrays.tot,
+                     satisfied))
+
+
+def _classify_relations(partition, G, arrays, satisfied):
+    """The relations of type 1, 2, and 3 as arrays of node indices.
+    
+    Returns a tuple of three pairs (x, y) of integer arrays, i.e. the k-th
+    relation of a type is the pair of nodes with indices x[k] and y[k] in
+    'arrays.nodes'.
+    """
+    
+    if arrays is None:
+        arrays = _GraphArrays(G)
+    mask, k = arrays.partition_mask(partition)
+    
+    pairs = ([], [], [])
+    
+    for inside, outside, T1, T2, T3 in _relation_masks(mask, k,
+                                                       arrays.color,
+                                                       arrays.adj,
+                                                       arrays.ncolors,
+                                                       satisfied=satisfied):
+        for T, T_pairs, Y in ((T1, pairs[0], outside),
+                              (T2, pairs[1], outside),
+                              (T3, pairs[2], inside)):
+            i, j = np.nonzero(T)
+            T_pairs.append( (inside[i], Y[j]) )
+    
+    def _concat(arrs):
+        return (np.concatenate(arrs) if arrs else
+                np.empty(0, dtype=np.intp))
+    
+    return tuple((_concat([x for x, _ in T_pairs]),
+                  _concat([y for _, y in T_pairs]))
+                 for T_pairs in pairs)
+
+
+def _list_relations(partition, G, arrays, satisfied):
+    
+    if arrays is None:
+        arrays = _GraphArrays(G)
+    nodes = arrays.nodes
+    
+    return tuple(list(zip(map(nodes.__getitem__, x.tolist()),
+                          map(nodes.__getitem__, y.tolist())))
+                 for x, y in _classify_relations(partition, G, arrays,
+                                                 satisfied))
+        
+        
+class _BipartitionDelta:
+    """Incremental objective function for single-node moves in a bipartition.
+    
+    For each of the two sets V_i, the color counts, the number of arcs from
+    V_i to each color, and the number of arcs inside V_i into each color are
+    maintained. The number of relations of type 1, 2, and 3 (cf.
+    '_relation_masks') of a set only depends on these values. Hence, the changes
+    of the objective for moving any of the nodes into the other set can be
+    computed at once in O(|V| * |colors|) time, and applying a move takes
+    O(|V| + |colors|) time.
+    """
+    
+    __slots__ = ('nodes', 'index', 'side', 'color', 'tot', 'E', 'A', 'M',
+                 'out', 'ind', 'n', 'size', 'sum_A', 'inner')
+    
+    def __init__(self, bipartition, G, arrays, satisfied):
+        
+        if arrays is None:
+            arrays = _GraphArrays(G)
+        V1, V2 = bipartition
+        
+        self.nodes = [*V1, *V2]
+        self.index = {v: i for i, v in enumerate(self.nodes)}
+        idx = np.array([arrays.index[v] for v in self.nodes], dtype=np.intp)
+        m, ncolors = len(idx), arrays.ncolors
+        
+        self.side = np.zeros(m, dtype=np.intp)
+        self.side[len(V1):] = 1
+        self.color = arrays.color[idx]
+        self.tot = arrays.tot
+        
+        # one-hot encoding of the colors
+        self.E = np.eye(ncolors, dtype=np.int64)[self.color]
+        
+        # (complemented) arcs between nodes of different colors
+        self.A = arrays.color_arcs[int(satisfied)][idx]
+        self.M = ((arrays.adj[np.ix_(idx, idx)] != satisfied) &
+                  (self.color[:, None] != self.color[None, :])
+                 ).astype(np.int64)
+        
+        # arcs from each node into (side, color), arcs into each node
+        # from each side
+        side_onehot = np.eye(2, dtype=np.int64)[self.side]
+        self.out = (self.M @ (side_onehot[:, :, None] *
+                              self.E[:, None, :]).reshape(m, 2 * ncolors)
+                   ).reshape(m, 2, ncolors)
+        self.ind = self.M.T @ side_onehot
+        
+        # aggregates of the two sets
+        self.n = np.zeros((2, ncolors), dtype=np.int64)
+        self.size = np.zeros(2, dtype=np.int64)
+        self.sum_A = np.zeros((2, ncolors), dtype=np.int64)
+        self.inner = np.zeros((2, ncolors), dtype=np.int64)
+        for i in range(2):
+            in_i = self.side == i
+            self.n[i] = self.E[in_i].sum(axis=0)
+            self.size[i] = in_i.sum()
+            self.sum_A[i] = self.A[in_i].sum(axis=0)
+            self.inner[i] = self.out[in_i, i].sum(axis=0)
+    
+    
+    def deltas(self):
+        """Change of the objective for moving each node into the other set.
+        
+        Returns
+        -------
+        dict
+            The nodes as keys and the changes of the objective as values.
+        """
+        
+        a, b = self.side, 1 - self.side
+        r = np.arange(len(self.nodes))
+        
+        current = _relations_from_color_sums(self.n, self.size, self.sum_A,
+                                             self.inner, self.tot)
+        removed = _relations_from_color_sums(
+            self.n[a] - self.E, self.size[a] - 1, self.sum_A[a] - self.A,
+            self.inner[a] - self.out[r, a] - self.ind[r, a][:, None] * self.E,
+            self.tot)
+        added = _relations_from_color_sums(
+            self.n[b] + self.E, self.size[b] + 1, self.sum_A[b] + self.A,
+            self.inner[b] + self.out[r, b] + self.ind[r, b][:, None] * self.E,
+            self.tot)
+        
+        delta = removed + added - current[a] - current[b]
+        
+        return dict(zip(self.nodes, delta.tolist()))
+    
+    
+    def move(self, x):
+        """Move the node x into the other set."""
+        
+        p = self.index[x]
+        a = self.side[p]
+        b = 1 - a
+        c = self.color[p]
+        
+        self.n[a, c] -= 1
+        self.n[b, c] += 1
+        self.size[a] -= 1
+        self.size[b] += 1
+        self.sum_A[a] -= self.A[p]
+        self.sum_A[b] += self.A[p]
+        self.inner[a] -= self.out[p, a]
+        self.inner[a, c] -= self.ind[p, a]
+        self.inner[b] += self.out[p, b]
+        self.inner[b, c] += self.ind[p, b]
+        
+        self.out[:, a, c] -= self.M[:, p]
+        self.out[:, b, c] += self.M[:, p]
+        self.ind[:, a] -= self.M[p]
+        self.ind[:, b] += self.M[p]
+        self.side[p] = b
+        
+        
+def unsatisfiability_cost(partition, G, arrays=None):
     """Return the unsatisfiability cost of a partition.
     
     This cost is the number of unsatisfiable (non-)arcs induced by the
@@ -126,6 +538,9 @@ def unsatisfiability_cost(partition, G):
         A partition for (a subset of) the nodes in the graph.
     G : networkx.DiGraph
         A directed graph.
+    arrays : _GraphArrays, optional
+        Precomputed array representation of `G`, e.g. the one of a
+        `BMGEditor` instance. It is constructed from `G` if not supplied.
     
     Returns
     -------
@@ -135,45 +550,34 @@ def unsatisfiability_cost(partition, G):
         in a tree.
     """
     
-    partition = list(partition)
-    color_sets = [{} for V in partition]
+    return _count_relations(partition, G, arrays, False)
+
+
+def unsatisfiability_cost_delta(bipartition, G, arrays=None):
+    """Incremental unsatisfiability cost for moves in a bipartition.
     
-    for V, colors in zip(partition, color_sets):
-        for v in V:
-            c = G.nodes[v]['color']
-            if c not in colors:
-                colors[c] = 1
-            else:
-                colors[c] += 1
+    Parameters
+    ----------
+    bipartition : list of two iterables of nodes
+        A bipartition for (a subset of) the nodes in the graph.
+    G : networkx.DiGraph
+        A directed graph.
+    arrays : _GraphArrays, optional
+        Precomputed array representation of `G`. It is constructed from `G`
+        if not supplied.
     
-    cost = 0
+    Returns
+    -------
+    _BipartitionDelta
+        An object whose method `deltas()` returns the changes of the
+        unsatisfiability cost for moving each node into the other set, and
+        whose method `move(x)` applies such a move.
+    """
     
-    for V, colors in zip(partition, color_sets):
-        
-        if not isinstance(V, set):
-            V = set(V)
-        
-        for x, y in itertools.product(V, G.nodes()):
-            
-            y_color = G.nodes[y]['color']
-            
-            # skip pairs with the same color
-            if G.nodes[x]['color'] == y_color:
-                continue
-            
-            if y not in V:
-                if G.has_edge(x, y):
-                    if colors.get(y_color):
-                        cost += 1
-                elif not colors.get(y_color):
-                    cost += 1
-            elif not G.has_edge(x, y) and colors.get(y_color) == 1:
-                cost += 1
-                    
-    return cost
-
-
-def get_U1_U2_U3(partition, G):
+    return _BipartitionDelta(bipartition, G, arrays, False)
+
+
+def get_U1_U2_U3(partition, G, arrays=None):
     """Get the unsatisfiable relations of each type for a partition.
     
     U1: (x, y) in E,
@@ -192,6 +596,9 @@ def get_U1_U2_U3(partition, G):
         A partition for (a subset of) the nodes in the graph.
     G : networkx.DiGraph
         A directed graph.
+    arrays : _GraphArrays, optional
+        Precomputed array representation of `G`. It is constructed from `G`
+        if not supplied.
     
     Returns
     -------
@@ -200,45 +607,10 @@ def get_U1_U2_U3(partition, G):
         split in a tree sorted by the three types.
     """
     
-    partition = list(partition)
-    color_sets = [{} for V in partition]
-    
-    for V, colors in zip(partition, color_sets):
-        for v in V:
-            c = G.nodes[v]['color']
-            if c not in colors:
-                colors[c] = 1
-            else:
-                colors[c] += 1
-    
-    U1, U2, U3 = [], [], []
-    
-    for V, colors in zip(partition, color_sets):
-        
-        if not isinstance(V, set):
-            V = set(V)
-        
-        for x, y in itertools.product(V, G.nodes()):
-            
-            y_color = G.nodes[y]['color']
-            
-            # skip pairs with the same color
-            if G.nodes[x]['color'] == y_color:
-                continue
-            
-            if y not in V:
-                if G.has_edge(x, y):
-                    if colors.get(y_color):
-                        U1.append( (x, y) )
-                elif not colors.get(y_color):
-                    U2.append( (x, y) )
-            elif not G.has_edge(x, y) and colors.get(y_color) == 1:
-                U3.append( (x, y) )
-                    
-    return U1, U2, U3
-
-
-def satisfied_relations(partition, G):
+    return _list_relations(partition, G, arrays, False)
+
+
+def satisfied_relations(partition, G, arrays=None):
     """Return the no. of arcs and non-arcs that are satisfied by a partition.
     
     Only considers pairs of vertices of different color.
@@ -249,6 +621,9 @@ def satisfied_relations(partition, G):
         A partition for (a subset of) the nodes in the graph.
     G : networkx.DiGraph
         A directed graph.
+    arrays : _GraphArrays, optional
+        Precomputed array representation of `G`, e.g. the one of a
+        `BMGEditor` instance. It is constructed from `G` if not supplied.
     
     Returns
     -------
@@ -258,45 +633,34 @@ def satisfied_relations(partition, G):
         a split in a leaf-colored tree.
     """
     
-    partition = list(partition)
-    color_sets = [{} for V in partition]
+    return _count_relations(partition, G, arrays, True)
+
+
+def satisfied_relations_delta(bipartition, G, arrays=None):
+    """Incremental no. of satisfied relations for moves in a bipartition.
     
-    for V, colors in zip(partition, color_sets):
-        for v in V:
-            c = G.nodes[v]['color']
-            if c not in colors:
-                colors[c] = 1
-            else:
-                colors[c] += 1
+    Parameters
+    ----------
+    bipartition : list of two iterables of nodes
+        A bipartition for (a subset of) the nodes in the graph.
+    G : networkx.DiGraph
+        A directed graph.
+    arrays : _GraphArrays, optional
+        Precomputed array representation of `G`. It is constructed from `G`
+        if not supplied.
     
-    count = 0
+    Returns
+    -------
+    _BipartitionDelta
+        An object whose method `deltas()` returns the changes of the number
+        of satisfied relations for moving each node into the other set, and
+        whose method `move(x)` applies such a move.
+    """
     
-    for V, colors in zip(partition, color_sets):
-        
-        if not isinstance(V, set):
-            V = set(V)
-        
-        for x, y in itertools.product(V, G.nodes()):
-            
-            y_color = G.nodes[y]['color']
-            
-            # skip pairs with the same color
-            if G.nodes[x]['color'] == y_color:
-                continue
-            
-            if y not in V:
-                if not G.has_edge(x, y):
-                    if colors.get(y_color):
-                        count += 1
-                elif not colors.get(y_color):
-                    count += 1
-            elif G.has_edge(x, y) and colors.get(y_color) == 1:
-                count += 1
-                    
-    return count
-
-
-def get_S1_S2_S3(partition, G):
+    return _BipartitionDelta(bipartition, G, arrays, True)
+
+
+def get_S1_S2_S3(partition, G, arrays=None):
     """Get the arcs and non-arcs that are satisfied by a partition of each type.
     
     S1: (x, y) notin E,
@@ -315,6 +679,9 @@ def get_S1_S2_S3(partition, G):
         A partition for (a subset of) the nodes in the graph.
     G : networkx.DiGraph
         A directed graph.
+    arrays : _GraphArrays, optional
+        Precomputed array representation of `G`. It is constructed from `G`
+        if not supplied.
     
     Returns
     -------
@@ -323,42 +690,7 @@ def get_S1_S2_S3(partition, G):
         partition corresponds to a split in a tree sorted by the three types.
     """
     
-    partition = list(partition)
-    color_sets = [{} for V in partition]
-    
-    for V, colors in zip(partition, color_sets):
-        for v in V:
-            c = G.nodes[v]['color']
-            if c not in colors:
-                colors[c] = 1
-            else:
-                colors[c] += 1
-    
-    S1, S2, S3 = [], [], []
-    
-    for V, colors in zip(partition, color_sets):
-        
-        if not isinstance(V, set):
-            V = set(V)
-        
-        for x, y in itertools.product(V, G.nodes()):
-            
-            y_color = G.nodes[y]['color']
-            
-            # skip pairs with the same color
-            if G.nodes[x]['color'] == y_color:
-                continue
-            
-            if y not in V:
-                if not G.has_edge(x, y):
-                    if colors.get(y_color):
-                        S1.append( (x, y) )
-                elif not colors.get(y_color):
-                    S2.append( (x, y) )
-            elif G.has_edge(x, y) and colors.get(y_color) == 1:
-                S3.append( (x, y) )
-                    
-    return S1, S2, S3
+    return _list_relations(partition, G, arrays, True)
 
 
 if __name__ == '__main__':
@@ -1,20 +1,174 @@
 # -*- coding: utf-8 -*-
 
+import os, random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 import networkx as nx
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 from tralda.datastructures.Tree import Tree, TreeNode
-from tralda.supertree.Build import aho_graph, mtt_partition
 
 from bmgedit.partitioning.Karger import Karger
 from bmgedit.partitioning.GreedyBipartition import (greedy_bipartition,
                                                     gradient_walk_bipartition)
 from bmgedit.partitioning.Louvain import Louvain, LouvainCustomObj
+from bmgedit.partitioning.StoerWagner import stoer_wagner
 from bmgedit.partitioning.NumberPartition import balanced_coarse_graining
 
 
 __author__ = 'David Schaller'
 
 
+def aho_graph(R, L, weighted=False, triple_weights=None):
+    """Construct the auxiliary graph (Aho graph) for BUILD.
+        
+    Edges {a,b} are optionally weighted by the number of occurrences, resp.,
+    sum of weights of triples of the form ab|x or ba|x. The weights are
+    accumulated in a dictionary and the graph is constructed at once.
+    
+    Parameters
+    ----------
+    R : collection of tuples
+        A collection of triples.
+    L : collection
+        A collection of leaf labels.
+    weighted : bool, optional
+        If True, weight the edges in the resulting graph according to the
+        number of corresponding triples (and their weights).
+        The default is False.
+    triple_weights : dict with tuples as keys and float values, optional
+        The weights of the triples. The default is None, in which case every
+        triple has weight one.
+    
+    Returns
+    -------
+    networkx.Graph
+        The undirected Aho graph.
+    """
+    
+    G = nx.Graph()
+    G.add_nodes_from(L)
+    
+    if not weighted:
+        G.add_edges_from((t[0], t[1]) for t in R)
+        return G
+    
+    weights = {}
+    for a, b, c in R:
+        w = triple_weights[a, b, c] if triple_weights else 1.0
+        if (b, a) in weights:
+            weights[b, a] += w
+        else:
+            weights[a, b] = weights.get((a, b), 0.0) + w
+    
+    G.add_weighted_edges_from((a, b, w) for (a, b), w in weights.items())
+    
+    return G
+
+
+def mtt_partition(L, R, F):
+    """Construct the auxiliary partition for the MTT algorithm.
+    
+    The leaves are mapped to integer indices and the partition is maintained
+    as a list of set labels together with the member lists of the sets. When
+    two sets are merged, the members of the smaller one are relabeled, i.e.,
+    the set of a leaf is always found in constant time.
+    
+    Parameters
+    ----------
+    L : collection
+        A collection of leaf labels.
+    R : collection of tuples
+        A collection of required triples.
+    F : collection of tuples
+        A collection of forbidden triples.
+        
+    Returns
+    -------
+    list of sets
+        The auxiliary partition for the MTT algorithm.
+    networkx.Graph
+        A graph representation of the auxiliary partition.
+    """
+    
+    # auxiliary graph initialized as Aho graph
+    G = aho_graph(R, L, weighted=False)
+    
+    components = list(nx.connected_components(G))
+    if len(components) == 1:
+        return components, G
+    
+    # auxiliary partition
+    leaves, label, members = [], [], []
+    index = {}
+    for i, s in enumerate(components):
+        members.append([])
+        for u in s:
+            index[u] = len(leaves)
+            leaves.append(u)
+            label.append(i)
+            members[i].append(index[u])
+    
+    F = list(F)
+    F_idx = [(index[x], index[y], index[z]) for x, y, z in F]
+    
+    # aux. set of forbidden triples
+    S = {j for j, (x, y, z) in enumerate(F_idx)
+         if label[x] == label[y] != label[z]}
+    
+    if not S:
+        return components, G
+    
+    # lookup of forb. triples to which u belongs (only needed if a merge
+    # happens)
+    by_leaf = [[] for _ in leaves]
+    for j, t in enumerate(F_idx):
+        for u in t:
+            by_leaf[u].append(j)
+    
+    while S:
+        j = S.pop()
+        _triple_connect(G, F[j])
+        
+        # relabel the smaller of the two merged sets
+        a, b = label[F_idx[j][0]], label[F_idx[j][2]]
+        if len(members[a]) > len(members[b]):
+            a, b = b, a
+        smaller_set = members[a]
+        for u in smaller_set:
+            label[u] = b
+        members[b].extend(smaller_set)
+        members[a] = None
+        
+        # update S by traversing the L(u)
+        for u in smaller_set:
+            for j in by_leaf[u]:
+                x, y, z = F_idx[j]
+                separated = label[x] == label[y] != label[z]
+                if j in S and not separated:
+                    S.remove(j)
+                    _triple_connect(G, F[j])
+                elif j not in S and separated:
+                    S.add(j)
+    
+    P = [{leaves[u] for u in m} for m in members if m is not None]
+    
+    return P, G
+
+
+def _triple_connect(G, t):
+    
+    G.add_edge(t[0], t[1])
+    G.add_edge(t[0], t[2])
+
+
 class Build2:
     """BUILD / MTT algorithm with optimal objective partition."""
     
@@ -25,8 +179,10 @@ class Build2:
                  obj_function=None,
                  minimize=True,
                  obj_function_args=None,
+                 obj_delta_function=None,
                  greedy_repeats=5,
-                 weighted_mincut=False, triple_weights=None,):
+                 weighted_mincut=False, triple_weights=None,
+                 processes=1, threads=1):
         
         self.R = R
         self.L = L
@@ -60,11 +216,21 @@ class Build2:
         self.obj_function =      obj_function
         self.minimize =          minimize
         self.obj_function_args = obj_function_args
+        self.obj_delta_function = obj_delta_function
         self.greedy_repeats =    greedy_repeats
             
         # parameters if bipartition method is mincut
         self.weighted_mincut = weighted_mincut
         self.triple_weights = triple_weights
+        
+        # no. of worker processes for the restarts of the randomized
+        # partition methods
+        self.processes = processes
+        self._pool = None
+        
+        # no. of threads for the parallel local moving phases of 'louvain'
+        # (only used in this process, a worker process runs a single thread)
+        self.threads = threads
     
     
     def build_tree(self, return_root=False):
@@ -77,127 +243,342 @@ class Build2:
         
         self.total_obj = 0
         
+        # leaves interned to integers and triples as (|R|, 3) arrays; the
+        # recursion passes on the indices of the triples (rows) that are
+        # contained in the current leaf set
+        self._leaf_idx = {u: i for i, u in enumerate(self.L)}
+        self._child = np.empty(len(self._leaf_idx), dtype=np.intp)
+        self._local = np.empty(len(self._leaf_idx), dtype=np.intp)
+        self._R_list = list(self.R)
+        self._R_arr = _triple_array(self._R_list, self._leaf_idx)
+        R_rows = np.arange(len(self._R_list))
         if self.F:
-            root = self._mtt(self.L, self.R, self.F)
-        else:
-            root = self._aho(self.L, self.R)
+            self._F_list = list(self.F)
+            self._F_arr = _triple_array(self._F_list, self._leaf_idx)
+            F_rows = np.arange(len(self._F_list))
+        
+        workers = min(self.processes, self.greedy_repeats,
+                      os.cpu_count() or 1)
+        if (self.allow_inconsistency and workers > 1 and
+            self.part_method != 'mincut'):
+            # the objective function and its arguments are only transferred
+            # once to each worker
+            self._pool = ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=_init_worker,
+                initargs=(self.obj_function, self.minimize,
+                          self.obj_function_args, self.obj_delta_function))
+        
+        try:
+            if self.F:
+                root = self._mtt(self.L, R_rows, F_rows)
+            else:
+                root = self._aho(self.L, R_rows)
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
             
         return root if return_root else Tree(root)
     
     
-    def _trivial_case(self, L):
+    def _trivial_case(self, node, L):
         
         if len(L) == 1:
-            leaf = L.pop()
-            return TreeNode(label=leaf)
+            node.label = L.pop()
         
         elif len(L) == 2:
-            node = TreeNode()
             for _ in range(2):
                 leaf = L.pop()
                 node.add_child(TreeNode(label=leaf))
-            return node
     
     
-    def _aho(self, L, R):
-        """Recursive Aho-algorithm."""
+    def _add_children(self, node, k):
+        """Place k new inner nodes below node (one for each set)."""
         
-        # trivial case: one or two leaves left in L
-        if len(L) <= 2:
-            return self._trivial_case(L)
-            
-        aux_graph = aho_graph(R, L, weighted=self.weighted_mincut,
-                                    triple_weights=self.triple_weights)
-        part = list(nx.connected_components(aux_graph))
-        
-        if len(part) < 2:
-            if not self.allow_inconsistency:
-                return False
-            else:
-                obj, part = partition(L, self.part_method,
-                                      obj_function=self.obj_function,
-                                      minimize=self.minimize,
-                                      args=self.obj_function_args,
-                                      aux_graph=aux_graph,
-                                      greedy_repeats=self.greedy_repeats)
-                self.total_obj += obj
-        
-        if self.binarize == 'b' and len(part) > 2:
-            part = balanced_coarse_graining(part)
-        
-        root = TreeNode()                   # place new inner node
-        node = root
-        for i, s in enumerate(part):
-            Li, Ri = set(s), []
-            for t in R:                     # construct triple subset
-                if Li.issuperset(t):
-                    Ri.append(t)
-            Ti = self._aho(Li, Ri)          # recursive call
-            if not Ti:
-                return False                # raise False to previous call
-            else:
-                node.add_child(Ti)          # add roots of the subtrees
+        children = []
+        for i in range(k):
+            child = TreeNode()
+            node.add_child(child)
+            children.append(child)
             
             # resolve to binary (caterpillar)
-            if self.binarize == 'c' and i < len(part)-2:
+            if self.binarize == 'c' and i < k-2:
                 new_node = TreeNode()
                 node.add_child(new_node)
                 node = new_node
+        
+        return children
+    
+    
+    def _partition(self, L, aux_graph):
+        """Partition L using the chosen method (in parallel if enabled)."""
+        
+        # small instances are not worth the inter-process communication
+        if self._pool is None or len(L) < _PARALLEL_MIN_SIZE:
+            return partition(L, self.part_method,
+                             obj_function=self.obj_function,
+                             minimize=self.minimize,
+                             args=self.obj_function_args,
+                             obj_delta_function=self.obj_delta_function,
+                             aux_graph=aux_graph,
+                             greedy_repeats=self.greedy_repeats,
+                             threads=self.threads)
+        
+        # one restart per task, seeded from the random state of this process
+        futures = [self._pool.submit(_partition_worker,
+                                     random.getrandbits(32),
+                                     L, self.part_method, aux_graph)
+                   for _ in range(self.greedy_repeats)]
+        
+        maximize = (self.part_method == 'louvain' or not self.minimize)
+        best_obj, best_part = None, None
+        for future in futures:
+            obj, part = future.result()
+            if (best_part is None or
+                (maximize and obj > best_obj) or
+                (not maximize and obj < best_obj)):
+                best_obj, best_part = obj, part
+        
+        return best_obj, best_part
+    
+    
+    def _split(self, part, T, rows):
+        """Distribute the triples (rows of T) to the sets of a partition."""
+        
+        for i, s in enumerate(part):
+            self._child[[self._leaf_idx[u] for u in s]] = i
+        
+        return _split_rows(self._child, T, rows, len(part))
+    
+    
+    def _aho_components(self, L, R):
+        """Connected components of the Aho graph for L and the triples R.
+        
+        The edges are collected in a sparse matrix w.r.t. the order of the
+        leaves in L, i.e. the components are in the same order as the ones
+        returned by 'nx.connected_components' on the Aho graph.
+        """
+        
+        L_list = list(L)
+        n = len(L_list)
+        self._local[[self._leaf_idx[u] for u in L_list]] = np.arange(n)
+        edges = self._local[self._R_arr[R, :2]]
+        
+        A = coo_matrix((np.ones(len(edges), dtype=np.int8),
+                        (edges[:, 0], edges[:, 1])), shape=(n, n))
+        k, labels = connected_components(A, directed=False)
+        
+        part = [set() for _ in range(k)]
+        for u, c in zip(L_list, labels.tolist()):
+            part[c].add(u)
+        
+        return part
+    
+    
+    def _aho(self, L, R):
+        """Aho-algorithm.
+        
+        The subproblems are processed with an explicit stack (in the same
+        depth-first order as the recursive formulation), which avoids
+        exceeding the recursion limit for deep trees.
+        """
+        
+        root = TreeNode()
+        stack = [(root, L, R)]
+        
+        while stack:
+            node, L, R = stack.pop()
+            
+            # trivial case: one or two leaves left in L
+            if len(L) <= 2:
+                self._trivial_case(node, L)
+                continue
+                
+            part = self._aho_components(L, R)
+            
+            if len(part) < 2:
+                if not self.allow_inconsistency:
+                    return False
+                else:
+                    # the Aho graph itself is only needed for the
+                    # partitioning
+                    aux_graph = aho_graph([self._R_list[j] for j in R], L,
+                                          weighted=self.weighted_mincut,
+                                          triple_weights=self.triple_weights)
+                    obj, part = self._partition(L, aux_graph)
+                    self.total_obj += obj
+            
+            if self.binarize == 'b' and len(part) > 2:
+                part = balanced_coarse_graining(part)
+            
+            R_split = self._split(part, self._R_arr, R)
+            
+            # subproblems for the new inner nodes, first set on top
+            children = self._add_children(node, len(part))
+            for i in reversed(range(len(part))):
+                stack.append((children[i], set(part[i]), R_split[i]))
    
         return root
     
     
     def _mtt(self, L, R, F):
-        """Recursive MTT algorithm."""
+        """MTT algorithm.
         
-        # trivial case: one or two leaves left in L
-        if len(L) <= 2:
-            return self._trivial_case(L)
+        The subproblems are processed with an explicit stack (in the same
+        depth-first order as the recursive formulation).
+        """
         
-        part, aux_graph = mtt_partition(L, R, F)
+        root = TreeNode()
+        stack = [(root, L, R, F)]
         
-        if len(part) < 2:
-            if not self.allow_inconsistency:
-                return False
-            else:
-                obj, part = partition(L, self.part_method,
-                                      obj_function=self.obj_function,
-                                      minimize=self.minimize,
-                                      args=self.obj_function_args,
-                                      aux_graph=aux_graph,
-                                      greedy_repeats=self.greedy_repeats)
-                self.total_obj += obj
-        
-        if self.binarize == 'b' and len(part) > 2:
-            part = balanced_coarse_graining(part)
-        
-        root = TreeNode()                   # place new inner node
-        node = root
-        for i, s in enumerate(part):
-            Li, Ri, Fi = set(s), [], []
-            for Xi, X in ((Ri, R), (Fi, F)):
-                for t in X:
-                    if Li.issuperset(t):
-                        Xi.append(t)
-            Ti = self._mtt(Li, Ri, Fi)      # recursive call
-            if not Ti:
-                return False                # raise False to previous call
-            else:
-                node.add_child(Ti)          # add roots of the subtrees
+        while stack:
+            node, L, R, F = stack.pop()
             
-            # resolve to binary (caterpillar)
-            if self.binarize == 'c' and i < len(part)-2:
-                new_node = TreeNode()
-                node.add_child(new_node)
-                node = new_node
+            # trivial case: one or two leaves left in L
+            if len(L) <= 2:
+                self._trivial_case(node, L)
+                continue
+            
+            part, aux_graph = mtt_partition(L,
+                                            [self._R_list[j] for j in R],
+                                            [self._F_list[j] for j in F])
+            
+            if len(part) < 2:
+                if not self.allow_inconsistency:
+                    return False
+                else:
+                    obj, part = self._partition(L, aux_graph)
+                    self.total_obj += obj
+            
+            if self.binarize == 'b' and len(part) > 2:
+                part = balanced_coarse_graining(part)
+            
+            R_split = self._split(part, self._R_arr, R)
+            F_split = self._split(part, self._F_arr, F)
+            
+            # subproblems for the new inner nodes, first set on top
+            children = self._add_children(node, len(part))
+            for i in reversed(range(len(part))):
+                stack.append((children[i], set(part[i]),
+                              R_split[i], F_split[i]))
    
         return root
     
     
+# min. no. of leaves for which the restarts are run in worker processes
+_PARALLEL_MIN_SIZE = 50
+
+# objective function etc. of the worker processes
+_worker_context = {}
+
+
+def _init_worker(obj_function, minimize, args, obj_delta_function):
+    
+    _worker_context.update(obj_function=obj_function,
+                           minimize=minimize,
+                           args=args,
+                           obj_delta_function=obj_delta_function)
+
+
+def _partition_worker(seed, L, method, aux_graph):
+    """A single restart of a randomized partition method."""
+    
+    random.seed(seed)
+    np.random.seed(seed)
+    
+    return partition(L, method,
+                     aux_graph=aux_graph,
+                     greedy_repeats=1,
+                     **_worker_context)
+
+
+def _triple_array(R, leaf_idx):
+    """Triples as an (|R|, 3) array of the integer indices of the leaves."""
+    
+    return np.array([[leaf_idx[a], leaf_idx[b], leaf_idx[c]]
+                     for a, b, c in R], dtype=np.int32).reshape(-1, 3)
+
+
+def _split_rows_numpy(child, T, rows, k):
+    """Distribute the triples (rows of T) to the sets of a partition.
+    
+    'child' maps (the index of) each leaf to the index of its set. A triple
+    is assigned to a set if all three of its leaves belong to it, triples
+    that are separated are dropped. The original order of the triples is
+    preserved within each set.
+    
+    Returns the kept rows grouped by set and the k+1 offsets of the groups.
+    """
+    
+    labels = child[T[rows]]
+    keep = (labels[:, 0] == labels[:, 1]) & (labels[:, 0] == labels[:, 2])
+    rows, labels = rows[keep], labels[keep, 0]
+    
+    order = np.argsort(labels, kind='stable')
+    indptr = np.zeros(k + 1, dtype=np.intp)
+    indptr[1:] = np.cumsum(np.bincount(labels, minlength=k))
+    
+    return rows[order], indptr
+
+
+def _split_rows_loops(child, T, rows, k):
+    """Distribute the triples (rows of T) to the sets of a partition.
+    
+    Same semantics as '_split_rows_numpy', as a counting pass followed by a
+    scatter pass over the triples.
+    """
+    
+    labels = np.empty(len(rows), dtype=np.intp)
+    indptr = np.zeros(k + 1, dtype=np.intp)
+    for j in range(len(rows)):
+        r = rows[j]
+        a = child[T[r, 0]]
+        if child[T[r, 1]] == a and child[T[r, 2]] == a:
+            labels[j] = a
+            indptr[a + 1] += 1
+        else:
+            labels[j] = -1
+    
+    for i in range(k):
+        indptr[i + 1] += indptr[i]
+    
+    out = np.empty(indptr[k], dtype=rows.dtype)
+    pos = indptr[:k].copy()
+    for j in range(len(rows)):
+        a = labels[j]
+        if a >= 0:
+            out[pos[a]] = rows[j]
+            pos[a] += 1
+    
+    return out, indptr
+
+
+if njit is not None:
+    _split_rows_nb = njit(cache=True)(_split_rows_loops)
+else:
+    _split_rows_nb = None
+
+
+def _split_rows(child, T, rows, k):
+    """Distribute the triples (rows of T) to the sets of a partition.
+    
+    Returns a list of k arrays with the rows assigned to each set.
+    """
+    
+    split = (_split_rows_nb if _split_rows_nb is not None else
+             _split_rows_numpy)
+    out, indptr = split(child, T, rows, k)
+    
+    return np.split(out, indptr[1:-1])
+    
+    
 def partition(L, method,
               obj_function=None, minimize=True, args=None,
+              obj_delta_function=None,
               aux_graph=None,
-              greedy_repeats=1):
+              greedy_repeats=1,
+              threads=1):
     
     best_obj = float('inf') if minimize else float('-inf')
     best_part = None
@@ -205,7 +586,7 @@ def partition(L, method,
     if method == 'mincut':
         
         # Stoer–Wagner algorithm
-        best_obj, best_part = nx.stoer_wagner(aux_graph)
+        best_obj, best_part = stoer_wagner(aux_graph)
     
     elif method == 'karger':
         karger = Karger(aux_graph)
@@ -222,7 +603,8 @@ def partition(L, method,
         for _ in range(greedy_repeats):
             obj, part = greedy_bipartition(L, obj_function, 
                                            minimize=minimize,
-                                           args=args)
+                                           args=args,
+                                           f_delta=obj_delta_function)
             if ((minimize and obj < best_obj) or
                 (not minimize and obj > best_obj)):
                 best_obj, best_part = obj, part
@@ -232,7 +614,8 @@ def partition(L, method,
         for _ in range(greedy_repeats):
             obj, part = gradient_walk_bipartition(L, obj_function,
                                                   minimize=minimize,
-                                                  args=args)
+                                                  args=args,
+                                                  f_delta=obj_delta_function)
             if ((minimize and obj < best_obj) or
                 (not minimize and obj > best_obj)):
                 best_obj, best_part = obj, part
@@ -242,7 +625,7 @@ def partition(L, method,
         best_obj = float('-inf')    # modularity is always maximized
         
         for _ in range(greedy_repeats):
-            louv = Louvain(aux_graph, at_least_two=True)
+            louv = Louvain(aux_graph, at_least_two=True, threads=threads)
             obj, part = louv.modularities[-1], louv.partitions[-1]
             if obj > best_obj:
                 best_obj, best_part = obj, part
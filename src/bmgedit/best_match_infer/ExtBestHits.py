@@ -6,13 +6,15 @@ Extended Best Hits Method.
 Implementation of the Extended Best Hits method for best match inference.
 """
 
-import os, subprocess, time
+import os, subprocess, tempfile, time
 
 from asymmetree.analysis.BestMatches import extended_best_hits
 from asymmetree.file_io.ScenarioFileIO import (parse_bmg_edges,
                                                matrix_to_phylip,
                                                species_to_genes)
 
+from bmgedit.best_match_infer.ScenarioFileIO import _temp_filename
+
 
 __author__ = 'David Schaller'
 
@@ -63,27 +65,28 @@ def ebh_qinfer(scenario,
     else:
         raise FileNotFoundError("path to qinfer binary file '{}' does not exist".format(binary_path))
     
-    output = -1
     command = [qinfer_command, matrix_filename, species_filename,
                "--disable-quartet", "--epsilon=" + str(epsilon)]
 
     if benchmark_file is not None:
         command.append( "--benchmark=" + benchmark_file )
     
-    # call 'qinfer' and measure execution time
-    start = time.time()
-    
-    try:
-        output = subprocess.run(command, stdout=subprocess.PIPE)
-    except:
-        raise FileNotFoundError("calling qinfer failed")
-    
-    exec_time = time.time() - start
-    
-    if output == -1:
-        raise Exception("no output from qinfer")
-    
-    bmg = parse_bmg_edges(output.stdout.decode(), scenario)
+    # call 'qinfer' and measure execution time; the output goes to a
+    # temporary file, so 'qinfer' does not wait for a pipe to be drained
+    with tempfile.TemporaryFile() as f:
+        start = time.perf_counter()
+        
+        try:
+            subprocess.run(command, stdout=f)
+        except:
+            raise FileNotFoundError("calling qinfer failed")
+        
+        exec_time = time.perf_counter() - start
+        
+        f.seek(0)
+        output = f.read().decode()
+    
+    bmg = parse_bmg_edges(output, scenario)
     
     return bmg, bmg.to_undirected(reciprocal=True), exec_time
 
@@ -97,18 +100,20 @@ def ebh_from_scenario(scenario, epsilon=0.5):
                    default=10E-8 (for limited float precision).
     """
 
-    matrix_filename = "temp.phylip"
-    species_filename = "temp_species.txt"
-    
-    matrix = scenario.get_distance_matrix()
-    matrix_to_phylip(matrix_filename, scenario.genes, matrix)
-    species_to_genes(species_filename, scenario)
-    
-    bmg, rbmg, exec_time = ebh_qinfer(scenario,
-                                      matrix_filename, species_filename,
-                                      epsilon=epsilon)
+    # unique temporary files, i.e. several runs can be executed concurrently
+    matrix_filename = _temp_filename('.phylip')
+    species_filename = _temp_filename('_species.txt')
     
-    os.remove(matrix_filename)
-    os.remove(species_filename)
-    
-    return bmg, rbmg, exec_time
\ No newline at end of file
+    try:
+        matrix = scenario.get_distance_matrix()
+        matrix_to_phylip(matrix_filename, scenario.genes, matrix)
+        species_to_genes(species_filename, scenario)
+        
+        bmg, rbmg, exec_time = ebh_qinfer(scenario,
+                                          matrix_filename, species_filename,
+                                          epsilon=epsilon)
+    finally:
+        os.remove(matrix_filename)
+        os.remove(species_filename)
+    
+    return bmg, rbmg, exec_time
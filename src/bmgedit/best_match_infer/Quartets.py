@@ -14,7 +14,8 @@ from tralda.datastructures.Tree import LCA
 from bmg_edit.best_match_infer.ScenarioFileIO import (parse_bmg_edges,
                                                       matrix_to_phylip,
                                                       species_to_genes,
-                                                      write_newick)
+                                                      write_newick,
+                                                      _temp_filename)
 
 
 __author__ = 'David Schaller'
@@ -455,24 +456,26 @@ def quartet_from_scenario(scenario, epsilon=-1,
                           specify the filename
     """
 
-    matrix_filename = "temp.phylip"
-    species_filename = "temp_species.txt"
-    tree_filename = "temp_tree.txt"
+    # unique temporary files, i.e. several runs can be executed concurrently
+    matrix_filename = _temp_filename('.phylip')
+    species_filename = _temp_filename('_species.txt')
+    tree_filename = _temp_filename('_tree.txt')
     
-    matrix = scenario.get_distance_matrix()
-    matrix_to_phylip(matrix_filename, scenario.genes, matrix)
-    species_to_genes(species_filename, scenario)
-    write_newick(tree_filename, scenario.S)
-    
-    bmg, rbmg, exec_time = quartet_qinfer(scenario,
-                                          matrix_filename, species_filename, tree_filename,
-                                          epsilon=epsilon,
-                                          closest_outgroups=closest_outgroups,
-                                          incongruence_threshold=incongruence_threshold,
-                                          benchmark_file=benchmark_file)
-    
-    os.remove(matrix_filename)
-    os.remove(species_filename)
-    os.remove(tree_filename)
+    try:
+        matrix = scenario.get_distance_matrix()
+        matrix_to_phylip(matrix_filename, scenario.genes, matrix)
+        species_to_genes(species_filename, scenario)
+        write_newick(tree_filename, scenario.S)
+        
+        bmg, rbmg, exec_time = quartet_qinfer(scenario,
+                                              matrix_filename, species_filename, tree_filename,
+                                              epsilon=epsilon,
+                                              closest_outgroups=closest_outgroups,
+                                              incongruence_threshold=incongruence_threshold,
+                                              benchmark_file=benchmark_file)
+    finally:
+        os.remove(matrix_filename)
+        os.remove(species_filename)
+        os.remove(tree_filename)
     
     return bmg, rbmg, exec_time
@@ -37,6 +37,9 @@ class Scenario:
         self.bmg, self.rbmg = bmg_from_tree(self.OGT, supply_rbmg=True)
         
         self.bmg_subtrees, self.rbmg_subtrees = self.reduce_to_subtrees(self.bmg, self.rbmg)
+        
+        # distance matrix of the genes (computed on demand)
+        self._D = None
     
     
     def _count_events(self):
@@ -66,12 +69,15 @@ class Scenario:
                     self.subtree_index.update({item: i for item in self.subtree_list[i]})
                 break
         
+        # subtree of S for each gene
+        self.gene_subtree = [self.subtree_index[gene.reconc]
+                             for gene in self.genes]
+        
         # max. number of outgroup genes (in T) for each subtree of S
-        self.outgroup_dict = {i: [] for i in range(len(self.subtree_list))}
-        for gene in self.genes:
-            for i in self.outgroup_dict.keys():
-                if self.subtree_index[gene.reconc] != i:
-                    self.outgroup_dict[i].append(gene)
+        self.outgroup_dict = {i: [gene for gene, j in zip(self.genes,
+                                                          self.gene_subtree)
+                                  if j != i]
+                              for i in range(len(self.subtree_list))}
     
     
     def get_data(self):
@@ -94,24 +100,26 @@ class Scenario:
         bmg_subtrees = nx.DiGraph()
         rbmg_subtrees = nx.Graph()
         
+        # subtree of S for each gene (same node set in BMG and RBMG)
+        node_subtree = {v: self.subtree_index[col]
+                        for v, col in full_bmg.nodes.data('color')}
+        
         for G_subtrees, true_G in [(bmg_subtrees, full_bmg),
                                    (rbmg_subtrees, full_rbmg)]:
             G_subtrees.add_nodes_from(true_G.nodes(data=True))
-            for u, v in true_G.edges:
-                u_col = true_G.nodes[u]['color']
-                v_col = true_G.nodes[v]['color']
-                
-                if self.subtree_index[u_col] == self.subtree_index[v_col]:
-                    G_subtrees.add_edge(u, v)
+            G_subtrees.add_edges_from((u, v) for u, v in true_G.edges
+                                      if node_subtree[u] == node_subtree[v])
         
         return bmg_subtrees, rbmg_subtrees
     
     
     def get_distance_matrix(self):
         
-        _, D = distance_matrix(self.OGT, leaf_order=self.genes)
+        # computed once, the observable gene tree is not modified
+        if self._D is None:
+            _, self._D = distance_matrix(self.OGT, leaf_order=self.genes)
         
-        return D
+        return self._D
     
     
     def possible_edges_bmg(self):
@@ -120,11 +128,7 @@ class Scenario:
         
         counts = [0 for i in range(len(self.subtree_list))]
         
-        for g in self.genes:
-            counts[self.subtree_index[g.reconc]] += 1
-        
-        possible_edges = 0
-        for count in counts:
-            possible_edges += (count * (count-1))
+        for i in self.gene_subtree:
+            counts[i] += 1
         
-        return possible_edges
+        return sum(count * (count-1) for count in counts)
@@ -4,7 +4,7 @@
 File I/O related to module 'Scenario'.
 """
 
-import itertools
+import itertools, os, tempfile
 
 import networkx as nx
 
@@ -17,12 +17,21 @@ __author__ = 'David Schaller'
 def matrix_to_phylip(filename, leaves, matrix):
     """Write the distance matrix in phylip format."""
     
+    # rows are converted to lists once, and each line is written at once
+    n = len(leaves)
     with open(filename, 'w') as f:
-        f.write(str(len(leaves)))
-        for i in range(len(leaves)):
-            f.write('\n' + str(leaves[i].label))
-            for j in range(len(leaves)):
-                f.write('\t' + str(matrix[i,j]))
+        f.write(str(n))
+        for leaf, row in zip(leaves, matrix[:n, :n].tolist()):
+            f.write('\n' + str(leaf.label) + '\t' + '\t'.join(map(str, row)))
+
+
+def _temp_filename(suffix):
+    """Create an empty temporary file and return its name."""
+    
+    fd, filename = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    
+    return filename
 
 
 def species_to_genes(filename, scenario):
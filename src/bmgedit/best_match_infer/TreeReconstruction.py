@@ -2,12 +2,13 @@
 
 import os, subprocess, itertools, time
 
-from tralda.datastructures.Tree import TreeNode
+import numpy as np
+
+from tralda.datastructures.Tree import Tree, TreeNode
 
 from asymmetree.analysis.BestMatches import bmg_from_tree
 
 from asymmetree.tools.PhyloTreeTools import (delete_and_reconnect,
-                                             distances_from_root,
                                              parse_newick,)
 
 from bmgedit.best_match_infer.ScenarioFileIO import matrix_to_phylip
@@ -69,11 +70,81 @@ def neighbor_joining(leaves, leaf_index, matrix_filename,
     newick = output.stdout.decode()
     
     tree = parse_newick(newick)
+    _restore_labels(tree, leaves)
+    
+    if return_calltime:
+        return tree, calltime
+    else:
+        return tree
+    
+
+def _neighbor_joining_numpy(leaves, matrix):
+    """Neighbor joining on a distance matrix with NumPy.
+    
+    Classical O(n^3) algorithm (Saitou and Nei 1987). As in the output of
+    RapidNJ, the resulting tree is unrooted, i.e. the last three nodes are
+    joined at the root.
+    """
+    
+    n = len(leaves)
+    nodes = [TreeNode(label=leaf.label, dist=0.0) for leaf in leaves]
+    
+    # inactive rows/columns are set to zero and excluded from the minimum
+    D = np.array(matrix, dtype=float)
+    active = np.ones(n, dtype=bool)
+    
+    for r in range(n, 3, -1):
+        S = D.sum(axis=1)
+        Q = (r - 2) * D - S[:, None] - S[None, :]
+        Q[~active, :] = np.inf
+        Q[:, ~active] = np.inf
+        np.fill_diagonal(Q, np.inf)
+        i, j = np.unravel_index(np.argmin(Q), Q.shape)
+        
+        # join i and j, the new node takes the place of i
+        dist_i = 0.5 * D[i, j] + (S[i] - S[j]) / (2 * (r - 2))
+        u = TreeNode(dist=0.0)
+        for x, dist in ((i, dist_i), (j, D[i, j] - dist_i)):
+            nodes[x].dist = float(dist)
+            u.add_child(nodes[x])
+        nodes[i] = u
+        
+        active[j] = False
+        row = np.where(active, 0.5 * (D[i, :] + D[j, :] - D[i, j]), 0.0)
+        row[i] = 0.0
+        D[i, :] = row
+        D[:, i] = row
+        D[j, :] = 0.0
+        D[:, j] = 0.0
+    
+    rest = np.flatnonzero(active)
+    root = TreeNode(dist=0.0)
+    
+    if len(rest) == 3:
+        a, b, c = rest
+        dists = (0.5 * (D[a, b] + D[a, c] - D[b, c]),
+                 0.5 * (D[a, b] + D[b, c] - D[a, c]),
+                 0.5 * (D[a, c] + D[b, c] - D[a, b]))
+    elif len(rest) == 2:
+        a, b = rest
+        dists = (0.5 * D[a, b], 0.5 * D[a, b])
+    else:
+        return Tree(nodes[rest[0]])
+    
+    for x, dist in zip(rest, dists):
+        nodes[x].dist = float(dist)
+        root.add_child(nodes[x])
+    
+    return Tree(root)
+
+
+def _restore_labels(tree, leaves):
+    """Restore the reconciliation of the leaves and label the inner nodes
+    with integers that are not used by the leaves."""
     
-    # restore (leaf) indeces and reconciliation
     leaf_dict = {leaf.label: leaf for leaf in leaves}
     index_counter = 0
-    for v in tree.preorder():
+    for v in _preorder(tree):
         if not v.children:
             v.reconc = leaf_dict[v.label].reconc
         else:
@@ -82,11 +153,6 @@ def neighbor_joining(leaves, leaf_index, matrix_filename,
             v.label = index_counter
             index_counter += 1
     
-    if return_calltime:
-        return tree, calltime
-    else:
-        return tree
-    
 
 def reroot(tree, node):
     
@@ -110,24 +176,59 @@ def reroot(tree, node):
         delete_and_reconnect(tree, old_root)
 
 
+def _preorder(tree):
+    """Preorder traversal with an explicit stack.
+    
+    Same order as 'tree.preorder()', but the recursive generators of the
+    latter take time proportional to the depth for each node and exceed
+    the recursion limit on deep (e.g. caterpillar-like NJ) trees.
+    """
+    
+    if not tree.root:
+        return
+    
+    stack = [tree.root]
+    while stack:
+        v = stack.pop()
+        yield v
+        stack.extend(list(v.children)[::-1])
+
+
 def midpoint_rooting(tree):
     
+    preorder = list(_preorder(tree))
+    
     # identify the two most distant leaves and their l.c.a.
-    distance_dict = distances_from_root(tree)
-    leaf_dict = tree.leaf_dict()
+    distance_dict = {}
+    for v in preorder:
+        if not v.parent:
+            distance_dict[v] = 0.0
+        else:
+            distance_dict[v] = distance_dict[v.parent] + v.dist
     max_dist, leaf1, leaf2, lca = float('-inf'), None, None, None
     max_label = 0
     
-    for v in tree.preorder():
+    # leaf with max. distance to the root in the subtree of each node (the
+    # first one in case of ties), only this leaf is a candidate for the pairs
+    # of leaves below two children of a node
+    farthest = {}
+    for v in reversed(preorder):
+        if not v.children:
+            farthest[v] = v
+        else:
+            farthest[v] = max((farthest[c] for c in v.children),
+                              key=distance_dict.__getitem__)
+    
+    for v in preorder:
         if v.children:
             for c1, c2 in itertools.combinations(v.children, 2):
-                for x in leaf_dict[c1]:
-                    x_dist = distance_dict[x] - distance_dict[v]
-                    for y in leaf_dict[c2]:
-                        y_dist = distance_dict[y] - distance_dict[v]
-                        if x_dist + y_dist > max_dist:
-                            max_dist, leaf1, leaf2, lca = x_dist + y_dist, x, y, v
-        max_label = max([max_label, v.label])
+                x, y = farthest[c1], farthest[c2]
+                x_dist = distance_dict[x] - distance_dict[v]
+                y_dist = distance_dict[y] - distance_dict[v]
+                if x_dist + y_dist > max_dist:
+                    max_dist, leaf1, leaf2, lca = x_dist + y_dist, x, y, v
+        if v.label > max_label:
+            max_label = v.label
     
     # identify the edge for the new root
     edge, cut_at = None, 0
@@ -162,7 +263,24 @@ def midpoint_rooting(tree):
         
 
 def nj_from_numpy_matrix(leaves, leaf_index, matrix,
-                         filename='temp.phylip'):
+                         filename='temp.phylip',
+                         backend='rapidnj'):
+    """Neighbor joining tree for a distance matrix.
+    
+    Keyword argument:
+        filename -- temporary file for the matrix (RapidNJ only)
+        backend -- 'rapidnj' (default) to call the external RapidNJ
+            program, or 'numpy' for a NumPy implementation that avoids
+            the file I/O and process start, e.g. for many small matrices
+    """
+    
+    if backend == 'numpy':
+        tree = _neighbor_joining_numpy(leaves, matrix)
+        _restore_labels(tree, leaves)
+        return tree
+    elif backend != 'rapidnj':
+        raise ValueError("unknown neighbor joining backend "\
+                         "'{}'".format(backend))
 
     matrix_to_phylip(filename, leaves, matrix)
     tree = neighbor_joining(leaves, leaf_index, filename)
@@ -3,6 +3,7 @@
 import itertools
 
 from docplex.mp.model import Model
+from docplex.mp.solution import SolveSolution
 
 import networkx as nx
 import tralda.tools.GraphTools as gt
@@ -48,6 +49,11 @@ class BMGEditor:
         # binary varibles pairs of vertices
         self.e = self.model.binary_var_dict(self.E, name='e')
         
+        # a BMG has no arcs between vertices of the same color
+        for x, y in self.E:
+            if self.graph.nodes[x]['color'] == self.graph.nodes[y]['color']:
+                self.e[x, y].ub = 0
+        
         # binary variable for each triple ab|c (= ba|c)
         triples = ((a, b, c)
                    for a, b, c in itertools.permutations(self.graph.nodes(), 3)
@@ -65,24 +71,23 @@ class BMGEditor:
                                              for p in range(self.n-2)),
                                             name='m')
         
-        # varibles for three-gamete condition
-        self.C = self.model.binary_var_dict(
+        # varibles for three-gamete condition (integral for binary M, hence
+        # they need not be binary variables themselves)
+        self.C = self.model.continuous_var_dict(
             ((p, q, gam) for p, q in itertools.combinations(range(self.n-2), 2)
                          for gam in range(3)),
-             name='C')
+             lb=0, ub=1, name='C')
         
     
     def _objective(self):
         """Sets the objective function."""
         
-        self.obj = self.model.linear_expr()
-        
-        # add (1 - e_xy) * E_xy + (1 - E_xy) * e_xy for all x, y
-        for x, y in self.E:
-            if self.E[x, y]:
-                self.obj += 1 - self.e[x, y]
-            else:
-                self.obj += self.e[x, y]
+        # sum of (1 - e_xy) * E_xy + (1 - E_xy) * e_xy for all x, y, i.e.
+        # no. of arcs in E plus e_xy with coefficient 1 - 2 * E_xy
+        keys = list(self.E)
+        self.obj = self.model.scal_prod([self.e[xy] for xy in keys],
+                                        [1 - 2 * self.E[xy] for xy in keys])
+        self.obj += sum(self.E.values())
         
         self.model.minimize(self.obj)
         
@@ -104,51 +109,51 @@ class BMGEditor:
         """Ensures that all informative triples of the graph are displayed
         by the tree but none of the forbidden triples."""
         
-        for x in self.graph.nodes():
-            for col in self.color_dict:
-                if self.graph.nodes[x]['color'] != col:
-                    for y1, y2 in itertools.permutations(self.color_dict[col],
-                                                         2):
-                        if x < y1:
-                            # informative triple x y1 | y2
-                            self.model.add_constraint(
-                                (self.e[x, y1] - self.e[x, y2] -
-                                 self.t[x, y1, y2] <= 0),
-                                ctname='it[{},{},{}]'.format(x, y1, y2)
-                                )
-                            # forbidden triple x y1 | y2
-                            self.model.add_constraint(
-                                (self.e[x, y1] + self.e[x, y2] +
-                                 self.t[x, y1, y2] <= 2),
-                                ctname='ft[{},{},{}]'.format(x, y1, y2)
-                                )
-                        else:
-                            # informative triple x y1 | y2
-                            self.model.add_constraint(
-                                (self.e[x, y1] - self.e[x, y2] -
-                                 self.t[y1, x, y2] <= 0),
-                                ctname='it[{},{},{}]'.format(x, y1, y2)
-                                )
-                            # forbidden triple x y1 | y2
-                            self.model.add_constraint(
-                                (self.e[x, y1] + self.e[x, y2] +
-                                 self.t[y1, x, y2] <= 2),
-                                ctname='ft[{},{},{}]'.format(x, y1, y2)
-                                )
-        
-        # set m((ab|c), p) correctly
-        for a, b, c, p in self.m:
-            
-            expr = (self.M[a, p] + self.M[b, p] + (1 - self.M[c, p]) - 
-                    3 * self.m[a, b, c, p])
-            self.model.add_constraint(expr >= 0)
-            self.model.add_constraint(expr <= 2)
+        # the constraints are collected and passed to the model at once,
+        # which is much faster than adding them one by one
+        cts, names = [], []
+        
+        e = self.e
+        
+        for x, x_color in self.graph.nodes(data='color'):
+            for col, Y in self.color_dict.items():
+                if x_color == col:
+                    continue
+                for y1, y2 in itertools.permutations(Y, 2):
+                    t = self.t[x, y1, y2] if x < y1 else self.t[y1, x, y2]
+                    
+                    # informative triple x y1 | y2
+                    cts.append(e[x, y1] - e[x, y2] - t <= 0)
+                    names.append('it[{},{},{}]'.format(x, y1, y2))
+                    
+                    # forbidden triple x y1 | y2
+                    cts.append(e[x, y1] + e[x, y2] + t <= 2)
+                    names.append('ft[{},{},{}]'.format(x, y1, y2))
+        
+        self.model.add_constraints(cts, names)
+        
+        # set m((ab|c), p) = M[a,p] and M[b,p] and not M[c,p] correctly;
+        # the disaggregated upper bounds give a tighter LP relaxation than
+        # the single constraint 3 * m <= M[a,p] + M[b,p] + 1 - M[c,p]
+        def _m_constraints():
+            for a, b, c, p in self.m:
+                m = self.m[a, b, c, p]
+                yield m <= self.M[a, p]
+                yield m <= self.M[b, p]
+                yield m <= 1 - self.M[c, p]
+                yield m >= self.M[a, p] + self.M[b, p] - self.M[c, p] - 1
+        
+        self.model.add_constraints(_m_constraints())
         
         # informative and forbidden triples
-        for a, b, c in self.t:
-            expr = self.model.sum((self.m[a, b, c, p] for p in range(self.n-2)))
-            self.model.add_constraint(self.t[a, b, c] <= expr)
-            self.model.add_constraint(expr <= (self.n - 2) * self.t[a, b, c])
+        def _t_constraints():
+            for a, b, c in self.t:
+                expr = self.model.sum((self.m[a, b, c, p]
+                                       for p in range(self.n-2)))
+                yield self.t[a, b, c] <= expr
+                yield expr <= (self.n - 2) * self.t[a, b, c]
+        
+        self.model.add_constraints(_t_constraints())
         
         
     def _proper_hierarchy(self):
@@ -173,19 +178,52 @@ class BMGEditor:
              for p, q in itertools.combinations(range(self.n-2), 2)))        
                                 
                                     
-    def optimize(self, time_limit=False):
-        """Solves the editing problem."""
+    def add_warm_start(self, graph):
+        """Use the arcs of a graph, e.g. a BMG obtained with one of the
+        heuristics, as a (partial) MIP start.
+        
+        Only the arc variables are fixed, CPLEX completes the remaining
+        variables. Must be called after 'build_model'.
+        """
+        
+        start = SolveSolution(self.model)
+        
+        for (x, y), variable in self.e.items():
+            start.add_var_value(variable, int(graph.has_edge(x, y)))
+        
+        self.model.add_mip_start(start)
+        
+    
+    def optimize(self, time_limit=False, threads=None):
+        """Solves the editing problem.
+        
+        Keyword arguments:
+            time_limit -- time limit in seconds, default is False (no limit)
+            threads -- max. number of threads used by CPLEX, default is None
+                in which case CPLEX decides (usually all cores are used);
+                if set, the deterministic parallel mode is used
+        """
+        
+        cplex_parameters = self.model.context.cplex_parameters
         
-        # set new time limit temporarily
+        # set new time limit and no. of threads temporarily
         if time_limit:
             original_time_limit = self.model.time_limit
             self.model.set_time_limit(time_limit)
+        if threads:
+            original_threads = cplex_parameters.threads.get()
+            original_parallel = cplex_parameters.parallel.get()
+            cplex_parameters.threads = threads
+            cplex_parameters.parallel = 1       # deterministic
         
         self.solution = self.model.solve(url=None, key=None)
         
-        # reset time limit
+        # reset time limit and no. of threads
         if time_limit:
             self.model.time_limit = original_time_limit
+        if threads:
+            cplex_parameters.threads = original_threads
+            cplex_parameters.parallel = original_parallel
         
         print('Solve details:')
         print(self.model.get_solve_details())
@@ -31,26 +31,40 @@ class EditorSuperClass:
               15: 'USER_OBJ_LIMIT',}
     
     
-    def __init__(self, graph):
+    def __init__(self, graph, debug_names=False):
+        """
+        Keyword argument:
+            debug_names -- if True, the variables and constraints are named
+                (e.g. for writing the model to a file), default is False
+                since the names are costly for the O(n^4) constraints
+        """
         
         self.graph = graph
         self.n = self.graph.order()
         self.color_dict = gt.sort_by_colors(graph)
+        self.debug_names = debug_names
         
     
     def build_model(self):
         
         # constant values repr. the edges in the original graph
-        self.E = {(x, y): int(self.graph.has_edge(x, y))
-                     for x in self.graph.nodes()
-                     for y in self.graph.nodes()
-                     if x != y}
+        self._arc_constants()
         
         # build model with variables and objective function
         self.model = gp.Model()
         
+        # optional callback passed to Gurobi, e.g. for lazy constraints
+        self._callback = None
+        
         # binary varibles pairs of vertices
-        self.e = self.model.addVars(self.E, vtype=GRB.BINARY, name='e')
+        self.e = self.model.addVars(self.E, vtype=GRB.BINARY,
+                                    name=self._name('e'))
+        
+        # a BMG has no arcs between vertices of the same color
+        same_color = [self.e[x, y] for x, y in self.E
+                      if self.graph.nodes[x]['color'] ==
+                         self.graph.nodes[y]['color']]
+        self.model.setAttr('UB', same_color, [0.0] * len(same_color))
         
         # finally sink all variables
         self.model.update()
@@ -59,21 +73,73 @@ class EditorSuperClass:
         self._objective()
         
     
+    def _name(self, prefix, *indices):
+        """Name of a constraint (or prefix for variables), empty if names
+        are disabled."""
+        
+        if not self.debug_names:
+            return ''
+        elif not indices:
+            return prefix
+        
+        return '{}[{}]'.format(prefix, ','.join(str(i) for i in indices))
+        
+    
+    def _arc_constants(self):
+        
+        self.E = {(x, y): int(self.graph.has_edge(x, y))
+                     for x in self.graph.nodes()
+                     for y in self.graph.nodes()
+                     if x != y}
+        
+    
+    def update_graph(self, graph):
+        """Replace the input graph by another graph on the same vertices
+        with the same colors.
+        
+        The variables and constraints only depend on the vertices and their
+        colors, hence only the objective function is updated instead of
+        rebuilding the model. Must be called after 'build_model'.
+        """
+        
+        if (graph.order() != self.n or
+            any(x not in graph or graph.nodes[x]['color'] != col
+                for x, col in self.graph.nodes(data='color'))):
+            raise ValueError('graph must have the same vertices and colors')
+        
+        self.graph = graph
+        self._arc_constants()
+        self._objective()
+        
+    
     def _objective(self):
         """Sets the objective function."""
         
-        self.obj = gp.LinExpr()
-        
-        # add (1 - e_xy) * E_xy + (1 - E_xy) * e_xy for all x, y
-        for x, y in self.E:
-            if self.E[x, y]:
-                self.obj += 1 - self.e[x, y]
-            else:
-                self.obj += self.e[x, y]
+        # sum of (1 - e_xy) * E_xy + (1 - E_xy) * e_xy for all x, y, i.e.
+        # no. of arcs in E plus e_xy with coefficient 1 - 2 * E_xy
+        keys = list(self.E)
+        self.obj = gp.LinExpr([1 - 2 * self.E[xy] for xy in keys],
+                              [self.e[xy] for xy in keys])
+        self.obj += sum(self.E.values())
         
         self.model.setObjective(self.obj, GRB.MINIMIZE)
                                 
                                     
+    def add_warm_start(self, graph):
+        """Use the arcs of a graph, e.g. a BMG obtained with one of the
+        heuristics, as a (partial) MIP start.
+        
+        Only the arc variables are set, Gurobi completes the remaining
+        variables. Must be called after 'build_model'. The start values are
+        kept by the model, i.e. they are also used if 'optimize' is called
+        again.
+        """
+        
+        keys = list(self.e)
+        self.model.setAttr('Start', [self.e[xy] for xy in keys],
+                           [int(graph.has_edge(*xy)) for xy in keys])
+        
+    
     def optimize(self, time_limit=False):
         """Solves the editing problem."""
         
@@ -82,7 +148,7 @@ class EditorSuperClass:
             original_time_limit = self.model.Params.timeLimit
             self.model.Params.timeLimit = time_limit
         
-        self.model.optimize()
+        self.model.optimize(self._callback)
         
         # reset time limit
         if time_limit:
@@ -92,13 +158,13 @@ class EditorSuperClass:
     def _sink_free_colored(self):
         """Ensures that each vertex has out-arcs to every other color."""
         
-        for x in self.graph.nodes():
-            for col in self.color_dict:
-                if self.graph.nodes[x]['color'] != col:
+        for x, x_color in self.graph.nodes(data='color'):
+            for col, Y in self.color_dict.items():
+                if x_color != col:
                     self.model.addConstr(
-                        gp.quicksum((self.e[x, y]
-                                     for y in self.color_dict[col])) >= 1,
-                        name='c[{},{}]'.format(x, col)
+                        gp.LinExpr([1.0] * len(Y),
+                                   [self.e[x, y] for y in Y]) >= 1,
+                        name=self._name('c', x, col)
                         )
         
         
@@ -134,9 +200,9 @@ class EditorSuperClass:
 class BMGEditor(EditorSuperClass):
     
     
-    def __init__(self, graph):
+    def __init__(self, graph, debug_names=False):
         
-        super().__init__(graph)
+        super().__init__(graph, debug_names=debug_names)
         
     
     def build_model(self):
@@ -158,27 +224,36 @@ class BMGEditor(EditorSuperClass):
         triples = ((a, b, c)
                    for a, b, c in itertools.permutations(self.graph.nodes(), 3)
                    if a < b)
-        self.t = self.model.addVars(triples, vtype=GRB.BINARY, name='t')
+        self.t = self.model.addVars(triples, vtype=GRB.BINARY,
+                                    name=self._name('t'))
         
         # matrix for hierarchy repr. the tree
         self.M = self.model.addVars(((a, p) for a in self.graph.nodes()
                                             for p in range(self.n-2)),
-                                vtype=GRB.BINARY, name='M')
+                                vtype=GRB.BINARY, name=self._name('M'))
         
         # a, b in custer p, but not c ?
         self.m = self.model.addVars(((a, b, c, p) for a, b, c in self.t
                                                   for p in range(self.n-2)),
-                                    vtype=GRB.BINARY, name='m')
+                                    vtype=GRB.BINARY, name=self._name('m'))
         
-        # varibles for three-gamete condition
+        # varibles for three-gamete condition (integral for binary M, hence
+        # they need not be binary variables themselves)
         self.C = self.model.addVars(
             ((p, q, gam) for p, q in itertools.combinations(range(self.n-2), 2)
                          for gam in range(3)),
-            vtype=GRB.BINARY, name='C')
+            lb=0.0, ub=1.0, vtype=GRB.CONTINUOUS, name=self._name('C'))
         
         # finally sink all variables
         self.model.update()
         
+        # branch on the hierarchy (which determines the tree) first, then
+        # on the triples, the arc variables keep the default priority 0
+        self.model.setAttr('BranchPriority', list(self.M.values()),
+                           [2] * len(self.M))
+        self.model.setAttr('BranchPriority', list(self.t.values()),
+                           [1] * len(self.t))
+        
 #        for v in self.model.getVars():
 #            print(v)
     
@@ -187,45 +262,32 @@ class BMGEditor(EditorSuperClass):
         """Ensures that all informative triples of the graph are displayed
         by the tree but none of the forbidden triples."""
         
-        for x in self.graph.nodes():
-            for col in self.color_dict:
-                if self.graph.nodes[x]['color'] != col:
-                    for y1, y2 in itertools.permutations(self.color_dict[col],
-                                                         2):
-                        if x < y1:
-                            # informative triple x y1 | y2
-                            self.model.addConstr(
-                                (self.e[x, y1] - self.e[x, y2] -
-                                 self.t[x, y1, y2] <= 0),
-                                name='it[{},{},{}]'.format(x, y1, y2)
-                                )
-                            # forbidden triple x y1 | y2
-                            self.model.addConstr(
-                                (self.e[x, y1] + self.e[x, y2] +
-                                 self.t[x, y1, y2] <= 2),
-                                name='ft[{},{},{}]'.format(x, y1, y2)
-                                )
-                        else:
-                            # informative triple x y1 | y2
-                            self.model.addConstr(
-                                (self.e[x, y1] - self.e[x, y2] -
-                                 self.t[y1, x, y2] <= 0),
-                                name='it[{},{},{}]'.format(x, y1, y2)
-                                )
-                            # forbidden triple x y1 | y2
-                            self.model.addConstr(
-                                (self.e[x, y1] + self.e[x, y2] +
-                                 self.t[y1, x, y2] <= 2),
-                                name='ft[{},{},{}]'.format(x, y1, y2)
-                                )
-        
-        # set m((ab|c), p) correctly
+        add_constr, e, t = self.model.addConstr, self.e, self.t
+        
+        for x, x_color in self.graph.nodes(data='color'):
+            for col, Y in self.color_dict.items():
+                if x_color == col:
+                    continue
+                for y1, y2 in itertools.permutations(Y, 2):
+                    t_xy1_y2 = t[x, y1, y2] if x < y1 else t[y1, x, y2]
+                    
+                    # informative triple x y1 | y2
+                    add_constr(e[x, y1] - e[x, y2] - t_xy1_y2 <= 0,
+                               name=self._name('it', x, y1, y2))
+                    # forbidden triple x y1 | y2
+                    add_constr(e[x, y1] + e[x, y2] + t_xy1_y2 <= 2,
+                               name=self._name('ft', x, y1, y2))
+        
+        # set m((ab|c), p) = M[a,p] and M[b,p] and not M[c,p] correctly;
+        # the disaggregated upper bounds give a tighter LP relaxation than
+        # the single constraint 3 * m <= M[a,p] + M[b,p] + 1 - M[c,p]
         for a, b, c, p in self.m:
-            
-            expr = (self.M[a, p] + self.M[b, p] + (1 - self.M[c, p]) - 
-                    3 * self.m[a, b, c, p])
-            self.model.addConstr(expr >= 0)
-            self.model.addConstr(expr <= 2)
+            m = self.m[a, b, c, p]
+            self.model.addConstr(m <= self.M[a, p])
+            self.model.addConstr(m <= self.M[b, p])
+            self.model.addConstr(m <= 1 - self.M[c, p])
+            self.model.addConstr(m >= self.M[a, p] + self.M[b, p] -
+                                      self.M[c, p] - 1)
         
         # informative and forbidden triples
         for a, b, c in self.t:
@@ -258,9 +320,9 @@ class BMGEditor(EditorSuperClass):
     
 class TwoBMGEditor(EditorSuperClass):
 
-    def __init__(self, graph):
+    def __init__(self, graph, debug_names=False):
 
-        super().__init__(graph)
+        super().__init__(graph, debug_names=debug_names)
         
         if len(self.color_dict) != 2:
             raise RuntimeError('not a 2-colored digraph')
@@ -289,14 +351,14 @@ class TwoBMGEditor(EditorSuperClass):
                     self.model.addConstr(
                         (self.e[x1, y1] + self.e[y1, x2] + self.e[y2, x2] - 
                          self.e[x1, y2] - self.e[y2, x1] <= 2),
-                        name='F1[{},{},{},{}]'.format(x1, x2, y1, y2)
+                        name=self._name('F1', x1, x2, y1, y2)
                         )
 
                     # type (F2)
                     self.model.addConstr(
                         (self.e[x1, y1] + self.e[y1, x2] + self.e[x2, y2] - 
                          self.e[x1, y2] <= 2),
-                        name='F2[{},{},{},{}]'.format(x1, x2, y1, y2)
+                        name=self._name('F2', x1, x2, y1, y2)
                         )
 
                 for y1, y2, y3 in itertools.permutations(self.color_dict[col2],
@@ -310,19 +372,27 @@ class TwoBMGEditor(EditorSuperClass):
                         (self.e[x1, y1] + self.e[x1, y3] +
                          self.e[x2, y2] + self.e[x2, y3] - 
                          self.e[x1, y2] - self.e[x2, y1] <= 3),
-                        name='F3[{},{},{},{},{}]'.format(x1, x2, y1, y2, y3)
+                        name=self._name('F3', x1, x2, y1, y2, y3)
                         )
 
 
 class BinaryBMGEditor(EditorSuperClass):
     
     
-    def __init__(self, graph):
+    def __init__(self, graph, debug_names=False):
         
-        super().__init__(graph)
+        super().__init__(graph, debug_names=debug_names)
         
     
-    def build_model(self):
+    def build_model(self, lazy_consistency=False):
+        """Build the model.
+        
+        Keyword arguments:
+            lazy_consistency -- if True, the O(n^4) compatibility constraints
+                are not added to the model a priori, but only those that are
+                violated by a new incumbent are added as lazy constraints
+                during the optimization; default is False
+        """
         
         # arc variables and objective
         super().build_model()
@@ -332,7 +402,7 @@ class BinaryBMGEditor(EditorSuperClass):
         # subject to constraints
         self._sink_free_colored()
         self._ext_inf_triples()
-        self._triple_consistency()
+        self._triple_consistency(lazy=lazy_consistency)
         
     
     def _additional_variables(self):
@@ -341,7 +411,8 @@ class BinaryBMGEditor(EditorSuperClass):
         triples = ((a, b, c)
                    for a, b, c in itertools.permutations(self.graph.nodes(), 3)
                    if a < b)
-        self.t = self.model.addVars(triples, vtype=GRB.BINARY, name='t')
+        self.t = self.model.addVars(triples, vtype=GRB.BINARY,
+                                    name=self._name('t'))
         
         # finally sink all variables
         self.model.update()
@@ -351,36 +422,26 @@ class BinaryBMGEditor(EditorSuperClass):
         """Ensures that all informative triples of the graph are displayed
         by the tree but none of the forbidden triples."""
         
-        for x in self.graph.nodes():
-            for col in self.color_dict:
-                if self.graph.nodes[x]['color'] != col:
-                    for y1, y2 in itertools.permutations(self.color_dict[col],
-                                                         2):
-                        if x < y1:
-                            # informative triple x y1 | y2
-                            self.model.addConstr(
-                                (self.e[x, y1] - self.e[x, y2] -
-                                 self.t[x, y1, y2] <= 0),
-                                name='it[{},{},{}]'.format(x, y1, y2)
-                                )
-                        else:
-                            # informative triple x y1 | y2
-                            self.model.addConstr(
-                                (self.e[x, y1] - self.e[x, y2] -
-                                 self.t[y1, x, y2] <= 0),
-                                name='it[{},{},{}]'.format(x, y1, y2)
-                                )
-                        
-                        # one direction is sufficient
-                        if y1 < y2:
-                            self.model.addConstr(
-                                (self.e[x, y1] + self.e[x, y2] -
-                                 self.t[y1, y2, x] <= 1),
-                                name='it[{},{},{}]'.format(x, y1, y2)
-                                )
-    
-    
-    def _triple_consistency(self):
+        add_constr, e, t = self.model.addConstr, self.e, self.t
+        
+        for x, x_color in self.graph.nodes(data='color'):
+            for col, Y in self.color_dict.items():
+                if x_color == col:
+                    continue
+                for y1, y2 in itertools.permutations(Y, 2):
+                    t_xy1_y2 = t[x, y1, y2] if x < y1 else t[y1, x, y2]
+                    
+                    # informative triple x y1 | y2
+                    add_constr(e[x, y1] - e[x, y2] - t_xy1_y2 <= 0,
+                               name=self._name('it', x, y1, y2))
+                    
+                    # one direction is sufficient
+                    if y1 < y2:
+                        add_constr(e[x, y1] + e[x, y2] - t[y1, y2, x] <= 1,
+                                   name=self._name('it', x, y1, y2))
+    
+    
+    def _triple_consistency(self, lazy=False):
         """Ensures concistency of all triples."""
         
         # strictly dense triple set
@@ -389,19 +450,61 @@ class BinaryBMGEditor(EditorSuperClass):
             
             self.model.addConstr((self.t[a, b, c] + self.t[a, c, b] +
                                   self.t[b, c, a] == 1),
-                                 name='d[{},{},{}]'.format(a, b, c))
+                                 name=self._name('d', a, b, c))
                                     
         # compatibility based on 2-order inference rules
+        if lazy:
+            self.model.Params.LazyConstraints = 1
+            self._callback = self._lazy_compatibility
+            return
+        
         for a, b, c, d in itertools.permutations(self.graph.nodes(), 4):
-            #a, b, c, d = sorted(triple)
-            
-            ab = sorted([a, b])
-            ad = sorted([a, d])
-            bd = sorted([b, d])
-                    
-            self.model.addConstr((2 * self.t[(*ab, c)] + 2 * self.t[(*ad, b)] -
-                                  self.t[(*bd, c)] - self.t[(*ad, c)] <= 2),
-                                 name='cp[{},{},{},{}]'.format(a, b, c, d))
+            self.model.addConstr(self._compatibility(a, b, c, d),
+                                 name=self._name('cp', a, b, c, d))
+    
+    
+    def _compatibility(self, a, b, c, d):
+        """Constraint for the rule ab|c, ad|b => bd|c, ad|c."""
+        
+        ab = sorted([a, b])
+        ad = sorted([a, d])
+        bd = sorted([b, d])
+        
+        return (2 * self.t[(*ab, c)] + 2 * self.t[(*ad, b)] -
+                self.t[(*bd, c)] - self.t[(*ad, c)] <= 2)
+    
+    
+    def _lazy_compatibility(self, model, where):
+        """Callback that adds the compatibility constraints violated by a
+        new incumbent."""
+        
+        if where != GRB.Callback.MIPSOL:
+            return
+        
+        keys = list(self.t)
+        values = model.cbGetSolution([self.t[key] for key in keys])
+        triples = {key for key, value in zip(keys, values) if value > 0.5}
+        
+        # triples ad|b by their outgroup b
+        by_outgroup = {}
+        for x, y, z in triples:
+            by_outgroup.setdefault(z, []).append((x, y))
+        
+        # only pairs ab|c, ad|b of displayed triples can violate the rule
+        for x, y, c in triples:
+            for a, b in ((x, y), (y, x)):
+                for u, v in by_outgroup.get(b, ()):
+                    if a == u:
+                        d = v
+                    elif a == v:
+                        d = u
+                    else:
+                        continue
+                    if d == c:
+                        continue
+                    if ((*sorted([b, d]), c) not in triples or
+                        (*sorted([a, d]), c) not in triples):
+                        model.cbLazy(self._compatibility(a, b, c, d))
         
 
 if __name__ == '__main__':
@@ -15,22 +15,97 @@ def partition_cut_value(partition, G):
     
     cut_value = 0
     
+    # walk the adjacencies instead of testing all pairs (x, y) in Vi x Vj
     for Vi, Vj in itertools.combinations(partition, 2):
-        for x, y in itertools.product(Vi, Vj):
-            if G.has_edge(x, y):
-                cut_value += 1
+        Vj = Vj if isinstance(Vj, (set, frozenset)) else set(Vj)
+        for x in Vi:
+            for y in G[x]:
+                if y in Vj:
+                    cut_value += 1
     
     return cut_value
     
 
+class _CutDelta:
+    """Changes of the cut value for moving single nodes of a bipartition.
+    
+    For each node x, the number of arcs from x into V2 and from V1 into x
+    is maintained. Moving x from V1 to V2 changes the cut value by
+    (V1 -> x) - (x -> V2), the reverse move by the negative of that.
+    """
+    
+    __slots__ = ('side', 'succ', 'pred', 'out2', 'in1')
+    
+    def __init__(self, bipartition, G):
+        
+        self.side = {}
+        for i, Vi in enumerate(bipartition):
+            for x in Vi:
+                self.side[x] = i
+        
+        if G.is_directed():
+            self.succ, self.pred = G.successors, G.predecessors
+        else:
+            self.succ = self.pred = G.neighbors
+        
+        self.out2 = {x: 0 for x in self.side}
+        self.in1 = {x: 0 for x in self.side}
+        for x, i in self.side.items():
+            for y in self.succ(x):
+                if y != x and y in self.side:
+                    if self.side[y] == 1:
+                        self.out2[x] += 1
+                    if i == 0:
+                        self.in1[y] += 1
+    
+    
+    def deltas(self):
+        
+        return {x: (self.in1[x] - self.out2[x] if i == 0 else
+                    self.out2[x] - self.in1[x])
+                for x, i in self.side.items()}
+    
+    
+    def move(self, x):
+        
+        # +1 if x moves from V1 into V2, -1 otherwise
+        sign = 1 if self.side[x] == 0 else -1
+        self.side[x] = 1 - self.side[x]
+        
+        for y in self.succ(x):
+            if y != x and y in self.side:
+                self.in1[y] -= sign
+        for y in self.pred(x):
+            if y != x and y in self.side:
+                self.out2[y] += sign
+
+
+def partition_cut_value_delta(bipartition, G):
+    """Incremental cut value for moves in a bipartition.
+    
+    Returns an object for the parameter 'f_delta' of 'greedy_bipartition'
+    and 'gradient_walk_bipartition' (with 'partition_cut_value' as the
+    objective). Each move takes time proportional to the degree of the node.
+    """
+    
+    return _CutDelta(bipartition, G)
+    
+
 def _move(from_set, to_set, x):
     
     from_set.remove(x)
     to_set.add(x)
 
 
-def greedy_bipartition(V, f_obj, minimize=True, args=()):
-    """Randomized greedy bipartitioning with custom objective function."""
+def greedy_bipartition(V, f_obj, minimize=True, args=(), f_delta=None):
+    """Randomized greedy bipartitioning with custom objective function.
+    
+    If 'f_delta' is supplied, it is called as f_delta([V1, V2], *args) and
+    must return an object whose method deltas() returns a dict with the
+    changes of the objective for moving each node into the other set and
+    whose method move(x) applies such a move. The objective is then only
+    evaluated once for the initial bipartition.
+    """
     
     if len(V) < 2:
         raise ValueError('iterable must have >=2 elements')
@@ -41,26 +116,40 @@ def greedy_bipartition(V, f_obj, minimize=True, args=()):
     best_obj = float('inf') if minimize else float('-inf')
     best_bp = None
     
+    if f_delta is not None:
+        tracker = f_delta([V1, V2], *args)
+        current_obj = f_obj([V1, V2], *args)
+    
     for _ in range(len(V)-1):
         
         best_obj_local = float('inf') if minimize else float('-inf')
         best_x = None
         
+        if f_delta is not None:
+            deltas = tracker.deltas()
+        
         for x in remaining:
-            _move(V2, V1, x)
-            obj = f_obj([V1, V2], *args)
+            if f_delta is None:
+                _move(V2, V1, x)
+                obj = f_obj([V1, V2], *args)
+                _move(V1, V2, x)
+            else:
+                obj = current_obj + deltas[x]
             if ((minimize and obj < best_obj_local) or
                 (not minimize and obj > best_obj_local)):
                 best_obj_local = obj
                 best_x = [x]
             elif obj == best_obj_local:
                 best_x.append(x) 
-            _move(V1, V2, x)
             
         x = random.choice(best_x)
         _move(V2, V1, x)
         remaining.remove(x)
         
+        if f_delta is not None:
+            tracker.move(x)
+            current_obj = best_obj_local
+        
         if ((minimize and best_obj_local < best_obj) or
             (not minimize and best_obj_local > best_obj)):
             best_obj = best_obj_local
@@ -77,7 +166,15 @@ def greedy_bipartition(V, f_obj, minimize=True, args=()):
 
 def gradient_walk_bipartition(V, f_obj, 
                               minimize=True, args=(),
-                              initial_bipartition=None):
+                              initial_bipartition=None,
+                              f_delta=None):
+    """Randomized adaptive walk with custom objective function.
+    
+    Starting from a random (or the supplied) bipartition, the node whose
+    move into the other set improves the objective the most is moved until
+    no further improvement is possible. See 'greedy_bipartition' for the
+    optional parameter 'f_delta'.
+    """
     
     if len(V) < 2:
         raise ValueError('iterable must have >=2 elements')
@@ -106,11 +203,17 @@ def gradient_walk_bipartition(V, f_obj,
     best_obj = f_obj([*P], *args)
     best_bp = [list(s) for s in P]
     
+    if f_delta is not None:
+        tracker = f_delta([*P], *args)
+    
     while True:
         
         best_obj_local = float('inf') if minimize else float('-inf')
         best_x = None
         
+        if f_delta is not None:
+            deltas = tracker.deltas()
+        
         for x in V:
             V1 = P[lookup[x]]
             V2 = P[(lookup[x] + 1) % 2]
@@ -119,15 +222,18 @@ def gradient_walk_bipartition(V, f_obj,
             if len(V1) == 1:
                 continue
             
-            _move(V1, V2, x)
-            obj = f_obj([V1, V2], *args)
+            if f_delta is None:
+                _move(V1, V2, x)
+                obj = f_obj([V1, V2], *args)
+                _move(V2, V1, x)
+            else:
+                obj = best_obj + deltas[x]
             if ((minimize and obj < best_obj_local) or
                 (not minimize and obj > best_obj_local)):
                 best_obj_local = obj
                 best_x = [x]
             elif obj == best_obj_local:
                 best_x.append(x) 
-            _move(V2, V1, x)
         
         if ((minimize and best_obj_local < best_obj) or
             (not minimize and best_obj_local > best_obj)):
@@ -136,6 +242,8 @@ def gradient_walk_bipartition(V, f_obj,
             V2 = P[(lookup[x] + 1) % 2]
             _move(V1, V2, x)
             lookup[x] = (lookup[x] + 1) % 2
+            if f_delta is not None:
+                tracker.move(x)
             
             best_obj = best_obj_local
             best_bp = [list(s) for s in P]
@@ -159,6 +267,11 @@ if __name__ == '__main__':
     for i in range(3):
         print( *greedy_bipartition(V, partition_cut_value, args=(G,)) )
     
+    print('---------')
+    for i in range(3):
+        print( *greedy_bipartition(V, partition_cut_value, args=(G,),
+                                   f_delta=partition_cut_value_delta) )
+    
     print('---------')
     for i in range(3):
         print( *gradient_walk_bipartition(V, partition_cut_value, args=(G,)) )
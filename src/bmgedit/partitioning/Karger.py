@@ -4,10 +4,14 @@
 Algorithms for graph (bi)partitioning.
 """
 
-import random, math
+import math
+import numpy as np
 import networkx as nx
 
-from tralda.datastructures import LinkedList, TreeSet
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 
 __author__ = 'David Schaller'
@@ -24,32 +28,54 @@ __author__ = 'David Schaller'
 # ----------------------------------------------------------------------------
 
 
-class _Supernode:
-    
-    def __init__(self, initial_node):
-        
-        self.nodes = LinkedList()
-        self.nodes.append(initial_node)
-        
-    
-    def __len__(self):
-        
-        return len(self.nodes)
-    
-    
-    def __lt__(self, other):
-        
-        return id(self) < id(other)
-    
-    
-    def merge_from(self, other):
-        
-        self.nodes.concatenate(other.nodes)
-        
+def _contract(n, edges, order):
+    """A single run of the contraction procedure on integer arrays.
+    
+    Contracting a uniformly random edge until two supernodes remain is
+    equivalent to processing the edges in random order and merging their
+    endpoints (skipping loops) via union-find. Returns the number of edges
+    in the cut and a boolean array that marks one of the two sides.
+    """
+    
+    parent = np.arange(n)
+    supernodes = n
+    
+    for k in order:
+        if supernodes == 2:
+            break
+        
+        # find with path halving
+        a = edges[k, 0]
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        b = edges[k, 1]
+        while parent[b] != b:
+            parent[b] = parent[parent[b]]
+            b = parent[b]
+        
+        if a != b:
+            parent[b] = a
+            supernodes -= 1
+    
+    root = np.empty(n, dtype=parent.dtype)
+    for x in range(n):
+        a = x
+        while parent[a] != a:
+            a = parent[a]
+        root[x] = a
+    
+    side = root == root[0]
+    cut_value = 0
+    for k in range(edges.shape[0]):
+        if side[edges[k, 0]] != side[edges[k, 1]]:
+            cut_value += 1
+    
+    return cut_value, side
 
-def _sort2(a, b):
-    
-    return (a, b) if a < b else (b, a)
+
+if njit is not None:
+    _contract = njit(cache=True)(_contract)
         
         
 class Karger():
@@ -66,6 +92,13 @@ class Karger():
             raise ValueError('graph not connected')
             
         self.graph = graph
+        
+        # nodes and (non-loop) edges as integer arrays
+        self.nodes = list(graph.nodes())
+        index = {v: i for i, v in enumerate(self.nodes)}
+        self.edges = np.array([(index[u], index[v])
+                               for u, v in graph.edges() if u != v],
+                              dtype=np.intp).reshape(-1, 2)
             
     
     def run(self):
@@ -88,7 +121,7 @@ class Karger():
         best_V1, best_V2, best_cutvalue = None, None, None
         
         for _ in range(runs):
-            V1, V2, cutvalue = self._karger_main()
+            cutvalue, (V1, V2) = self._karger_main()
             
             if not best_cutvalue or cutvalue < best_cutvalue:
                 best_V1, best_V2, best_cutvalue = V1, V2, cutvalue
@@ -115,93 +148,17 @@ class Karger():
         
         n = self.graph.order()
         return round(n**2 * math.log(n))
-    
-        
-    def _full_edge_set(self):
-        
-        # construct the balanced search tree for the full edge set once
-        if not hasattr(self, 'full_egde_set'):
-            self.full_egde_set = TreeSet()
-            for u, v in self.graph.edges():
-                self.full_egde_set.add( (u, v) )
-        
-        # otherwise copy which is O(|E|)
-        return self.full_egde_set.copy()
-        
-        
-    def _initialize(self):
-        
-        self.supernodes = set()
-        self.supernode_dict = {}            # maps node --> supernode
-        self.superedges = {}                # maps superedge --> edges
-        self.edges = self._full_edge_set()  # set of all (non-loop) edges
-        
-        for v in self.graph.nodes():
-            sn = _Supernode(v)
-            self.supernode_dict[v] = sn
-            self.supernodes.add(sn)
-        
-        for u, v in self.graph.edges():
-            u_sn = self.supernode_dict[u]
-            v_sn = self.supernode_dict[v]
-            e = _sort2(u_sn, v_sn)
-            self.superedges[e] = LinkedList( [(u, v)] )
-            
-            
-    def _merge(self, a, b):
-        """Merge two supernodes a and b."""
-        
-        # bigger supernode becomes the new supernode x
-        if len(a) >= len(b):
-            x = a
-            other = b
-        else:
-            x = b
-            other = a
-            
-        for v in other.nodes:
-            self.supernode_dict[v] = x
-        x.merge_from(other)
-        self.supernodes.remove(other)
-        
-        for d in self.supernodes:
-            
-            if d is x:
-                continue
-            
-            # merge the edge lists of superedges ad and bd
-            edges_xd = LinkedList()
-            for se in (_sort2(a, d), _sort2(b, d)):
-                if se in self.superedges:
-                    edges_xd.concatenate(self.superedges[se])
-                    del self.superedges[se]
-            if edges_xd:
-                self.superedges[_sort2(x, d)] = edges_xd
                 
                 
     def _karger_main(self):
         
-        self._initialize()
-        
-        while len(self.supernodes) > 2:
-            
-            u, v = random.choice(self.edges)
-            u_sn = self.supernode_dict[u]
-            v_sn = self.supernode_dict[v]
-            
-            self._merge(u_sn, v_sn)
-            
-            se = _sort2(u_sn, v_sn)
-            self.edges.difference_update(self.superedges[se])
-            del self.superedges[se]
+        order = np.random.permutation(len(self.edges))
+        cut_value, side = _contract(len(self.nodes), self.edges, order)
         
-        x = self.supernodes.pop()
-        y = self.supernodes.pop()
-
-        cut_value = len(self.superedges[_sort2(x, y)])
-        # print('cut_edges', list(self.superedges[_sort2(x, y)]))
+        V1 = [v for v, s in zip(self.nodes, side) if s]
+        V2 = [v for v, s in zip(self.nodes, side) if not s]
             
-        return cut_value, [list(x.nodes), list(y.nodes)]
+        return int(cut_value), [V1, V2]
         
     
 
@@ -11,46 +11,20 @@ References
 """
 
 import random, itertools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import networkx as nx
+from scipy.sparse import coo_matrix
 from networkx.algorithms.community import modularity
 
-
-__author__ = 'David Schaller'
+try:
+    from numba import njit
+except ImportError:
+    njit = None
 
 
-class _Supernode:
-    """Wrapper class for communities on the previous levels.
-    
-    The communities found in each level are the nodes in the next level. This
-    class contains all nodes of the original graph that belong to such a 
-    supernode.
-    """
-    
-    __slots__ = ('nodes',)
-    
-    def __init__(self):
-        
-        self.nodes = []
-    
-    
-    def __iter__(self):
-        
-        return iter(self.nodes)
-    
-    
-    def __next__(self):
-        
-        pass
-    
-    
-    def append(self, node):
-        
-        self.nodes.append(node)
-    
-    
-    def extend(self, nodes):
-        
-        self.nodes.extend(nodes)
+__author__ = 'David Schaller'
 
 
 class Louvain:
@@ -66,7 +40,8 @@ class Louvain:
     
     def __init__(self, graph, weight='weight',
                  at_least_two=False,
-                 print_info=False):
+                 print_info=False,
+                 threads=1):
         """Constructor for the Louvain class.
         
         Runs the identification of communities.
@@ -86,6 +61,11 @@ class Louvain:
         print_info : bool, optional
             Print the modularity results after each level (the default is
             False).
+        threads : int, optional
+            If greater than 1 and Numba is available, the local moving phase
+            of each (sufficiently large) level is run with this number of
+            different random node orders in parallel threads, and the result
+            with the highest modularity is kept (the default is 1).
         """
         
         if not isinstance(graph, nx.Graph) or graph.is_directed():
@@ -95,82 +75,63 @@ class Louvain:
         self.weight = weight
         self.at_least_two = at_least_two
         self.print_info = print_info
+        self.threads = threads
         
         self._run()
         
     
     def _run(self):
         
-        self.partitions = [ [{x} for x in self.orig_graph.nodes()] ]
+        nodes = list(self.orig_graph.nodes())
+        self.partitions = [ [{x} for x in nodes] ]
         
         # modularity is not defined for egdeless / zero-weight graphs
         if not self.orig_graph.size(weight=self.weight):
             self.modularities = [None]
             return
         
-        self.modularities = [ modularity(self.orig_graph,
-                                         self.partitions[0],
-                                         weight=self.weight) ]
+        # the graph of each level is represented by CSR arrays, its nodes
+        # (= communities of the previous level) by the original nodes they
+        # contain; the first level is the original graph
+        adjacency = _aggregate(
+            *_adjacency_arrays(self.orig_graph, nodes, self.weight),
+            np.arange(len(nodes)), len(nodes))
+        members = [[x] for x in nodes]
         
-        # construct the graph for the first level
-        graph = self._next_level_graph(self.orig_graph, self.partitions[0])
+        self.modularities = [ _modularity(*adjacency) ]
         
         while True:
             
-            level = _Level(graph, weight=self.weight,
-                           at_least_two=self.at_least_two)
+            level = _Level(None, adjacency=adjacency,
+                           at_least_two=self.at_least_two,
+                           threads=self.threads)
             
             if not level.moved_on_level:
                 break
             
-            # partition of the supernodes (= found communities)
-            sn_part = list(level.communities.values())
-            mod = modularity(graph, sn_part, weight=self.weight)
+            # the found communities are the nodes of the next level
+            com = np.empty(len(members), dtype=np.intp)
+            for i, community in enumerate(level.communities.values()):
+                com[list(community)] = i
+            members = [list(itertools.chain.from_iterable(members[x]
+                                                          for x in community))
+                       for community in level.communities.values()]
+            adjacency = _aggregate(*adjacency, com, len(members))
             
-            self.partitions.append(level.get_partition())
-            self.modularities.append(mod)
-            
-            graph = self._next_level_graph(graph, sn_part)
+            # the gains in the local moving phase are exact, hence the
+            # modularity need not be recomputed
+            self.partitions.append([set(sn) for sn in members])
+            self.modularities.append(self.modularities[-1] + level.total_gain)
             
             if self.print_info:
                 print('----- Level {} -----'.format(len(self.partitions)-1))
                 print('computed gain:',
                       self.modularities[-2], '+', level.total_gain,
-                      '=', self.modularities[-2] + level.total_gain)
-                print('mod. based on supernodes:', mod)
+                      '=', self.modularities[-1])
+                print('mod. based on supernodes:', _modularity(*adjacency))
                 print('mod. based on original graph',
                       modularity(self.orig_graph, self.partitions[-1],
                                  weight=self.weight))
-    
-    
-    def _next_level_graph(self, graph, partition):
-        
-        nl_graph = nx.Graph()
-        
-        # maps the old supernode to the supernode in the next level
-        old_to_new = {}
-        
-        for part_set in partition:
-            new_node = _Supernode()
-            nl_graph.add_node(new_node)
-            for old_node in part_set:
-                if isinstance(old_node, _Supernode):
-                    new_node.extend(old_node)
-                else:
-                    new_node.append(old_node)
-                old_to_new[old_node] = new_node
-        
-        for x, y, data in graph.edges(data=True):
-            w = data.get(self.weight, 1.0)
-            u = old_to_new[x]
-            v = old_to_new[y]
-            if nl_graph.has_edge(u, v):
-                nl_graph[u][v][self.weight] += w
-            else:
-                nl_graph.add_edge(u, v)
-                nl_graph[u][v][self.weight] = w
-        
-        return nl_graph
 
 
 class LouvainCustomObj:
@@ -230,14 +191,22 @@ class LouvainCustomObj:
     
     def _run(self):
         
-        self.partitions = [ [{x} for x in self.orig_graph.nodes()] ]
+        nodes = list(self.orig_graph.nodes())
+        self.partitions = [ [{x} for x in nodes] ]
         self.objectives = [ self.obj_function(self.partitions[0],
                                               *self.args) ]
         
         min_factor = 1 if self.minimize else -1
         
-        # construct the graph for the first level
-        graph = self._next_level_graph(self.orig_graph, self.partitions[0])
+        # the nodes of the graph of each level are the integers 0, ..., n-1,
+        # 'members' contains the original nodes of each of them; the first
+        # level is the original graph
+        index = {x: i for i, x in enumerate(nodes)}
+        graph = nx.Graph()
+        graph.add_nodes_from(range(len(nodes)))
+        graph.add_edges_from((index[x], index[y])
+                             for x, y in self.orig_graph.edges())
+        members = [[x] for x in nodes]
         
         while True:
             
@@ -245,20 +214,21 @@ class LouvainCustomObj:
                            obj_function=self.obj_function,
                            minimize=self.minimize,
                            args=self.args,
-                           at_least_two=self.at_least_two)
+                           at_least_two=self.at_least_two,
+                           members=members)
             
             if not level.moved_on_level:
                 break
             
-            # partition of the supernodes (= found communities)
+            # partition of the original nodes (= found communities)
             part = level.get_partition()
             
             self.partitions.append(part)
             self.objectives.append(self.objectives[-1] - 
                                    min_factor * level.total_gain)
             
-            graph = self._next_level_graph(graph,
-                                           list(level.communities.values()))
+            graph, members = self._next_level_graph(
+                graph, list(level.communities.values()), members)
             
             if self.print_info:
                 print('----- Level {} -----'.format(len(self.partitions)-1))
@@ -269,38 +239,43 @@ class LouvainCustomObj:
                                         *self.args))
     
     
-    def _next_level_graph(self, graph, partition):
+    def _next_level_graph(self, graph, partition, members):
         
         nl_graph = nx.Graph()
+        nl_graph.add_nodes_from(range(len(partition)))
         
-        # maps the old supernode to the supernode in the next level
-        old_to_new = {}
+        # maps the old nodes to the nodes in the next level
+        old_to_new = [0] * len(members)
+        new_members = []
         
-        for part_set in partition:
-            new_node = _Supernode()
-            nl_graph.add_node(new_node)
+        for new_node, part_set in enumerate(partition):
+            new_members.append(list(itertools.chain.from_iterable(
+                members[old_node] for old_node in part_set)))
             for old_node in part_set:
-                if isinstance(old_node, _Supernode):
-                    new_node.extend(old_node)
-                else:
-                    new_node.append(old_node)
                 old_to_new[old_node] = new_node
         
-        for x, y, data in graph.edges(data=True):
-            u = old_to_new[x]
-            v = old_to_new[y]
-            if not nl_graph.has_edge(u, v):
-                nl_graph.add_edge(u, v)
+        nl_graph.add_edges_from((old_to_new[x], old_to_new[y])
+                                for x, y in graph.edges())
         
-        return nl_graph
+        return nl_graph, new_members
         
         
 class _Level:
     """Clustering on a single level in the Louvain method."""
     
+    # min. number of nodes of a level for parallel local moving phases
+    parallel_min_nodes = 1000
+    
     def __init__(self, graph, weight='weight',
                  obj_function=None, minimize=True, args=(),
-                 at_least_two=False,):
+                 at_least_two=False, adjacency=None, threads=1,
+                 members=None):
+        """
+        The nodes are the integers 0, ..., n-1. For a custom objective
+        function, 'members' contains the original nodes of each of them. For
+        modularity (i.e. if 'obj_function' is None), the graph is given by
+        CSR arrays 'adjacency' (see '_adjacency_arrays') instead.
+        """
         
         self.graph = graph
         self.weight = weight
@@ -308,9 +283,15 @@ class _Level:
         self._opt_mode = 1 if minimize else -1
         self.args = args
         self.at_least_two = at_least_two
+        self.threads = threads
+        self.members = members
         
-        self.nodes = [x for x in self.graph.nodes()]
-        random.shuffle(self.nodes)
+        if adjacency is None:
+            self.nodes = [x for x in self.graph.nodes()]
+            random.shuffle(self.nodes)
+        else:
+            self._order = np.random.permutation(len(adjacency[0]) - 1)
+            self.nodes = self._order.tolist()
         
         self.node_to_com = {x: i for i, x in enumerate(self.nodes)}
         self.communities = {i: {x} for x, i in self.node_to_com.items()}
@@ -319,88 +300,69 @@ class _Level:
         self.total_gain = 0.0
         
         if self.obj_function is None:
-            self._cluster_by_modularity()
+            self._cluster_by_modularity(adjacency)
         else:
             self._cluster_by_obj()
     
     
-    def _cluster_by_modularity(self):
+    def _cluster_by_modularity(self, adjacency):
         
-        # sum of all edge weight
-        m = self.graph.size(weight=self.weight)
-        
-        # for an edgeless graph, every node is in its own cluster
-        if m == 0:
+        if (njit is not None and self.threads > 1 and
+            len(self.nodes) >= self.parallel_min_nodes):
+            self._parallel_local_moving(adjacency)
             return
         
-        # sum of the weights of the links incident to nodes in the community
-        com_tot = {i: 0 for i in self.communities.keys()}
+        # the nodes are the indices in the CSR arrays (= initial community
+        # ids), they are visited in the order of self.nodes
+        com = np.arange(len(self.nodes))
+        if njit is not None:
+            self.moved_on_level, self.total_gain = _local_moving(
+                *adjacency, self._order, com, self.at_least_two)
+            com = com.tolist()
+        else:
+            # indexing lists is faster than arrays in pure Python
+            com = com.tolist()
+            self.moved_on_level, self.total_gain = _local_moving(
+                *(a.tolist() for a in adjacency), self.nodes, com,
+                self.at_least_two)
+        
+        self._set_communities(com)
+    
+    
+    def _parallel_local_moving(self, adjacency):
+        """Independent local moving phases for different node orders.
+        
+        The compiled kernel releases the GIL, so the threads run in
+        parallel. All runs start from the singletons, hence the run with the
+        largest total gain yields the highest modularity.
+        """
+        
+        orders = [self._order] + [np.random.permutation(len(self.nodes))
+                                  for _ in range(self.threads - 1)]
+        coms = [np.arange(len(self.nodes)) for _ in orders]
         
-        # sum of the weights of all edges incident to nodes
-        k = {x: 0 for x in self.nodes}
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            results = list(executor.map(
+                lambda order, com: _local_moving(
+                    *adjacency, order, com, self.at_least_two),
+                orders, coms))
         
-        for x, y, data in self.graph.edges(data=True):
-            w = data.get(self.weight, 1.0)
-            k[x] += w
-            k[y] += w
-            com_tot[self.node_to_com[x]] += w
-            com_tot[self.node_to_com[y]] += w
+        # the first run is preferred in case of ties
+        best = max(range(len(orders)), key=lambda i: (results[i][1], -i))
+        self.nodes = orders[best].tolist()
+        self.moved_on_level, self.total_gain = results[best]
+        self._set_communities(coms[best].tolist())
     
-        while True:
-            moved_node = False
-            
-            for x in self.nodes:
-                
-                C_x = self.node_to_com[x]
-                
-                # check if we would merge the last two communities
-                if (self.at_least_two and len(self.communities) == 2 and
-                    len(self.communities[C_x]) == 1):
-                    continue
-                
-                # maps community C to the sum of weights of the links of x to
-                # elements in C \ {x}
-                k_x_in = self._weight_sums_to_communities(x)
-                
-                # remove x from its community
-                self.communities[C_x].remove(x)
-                com_tot[C_x] -= k[x]
-                
-                # C_x is preferred in case of ties, i.e. stays in its original
-                # community
-                
-                # equation in Blondel et al. can be simplified to this
-                cost_removal = (k_x_in[C_x] - com_tot[C_x] * k[x] / (2 * m)) / m
-                best_gain = cost_removal
-                best_C = C_x
-                visited = {C_x}
-                
-                for y in self.graph.neighbors(x):
-                    
-                    C_y = self.node_to_com[y]
-                    if C_y in visited:
-                        continue
-                    
-                    new_gain = (k_x_in[C_y] - com_tot[C_y] * k[x] / (2 * m)) / m
-                    
-                    if new_gain > best_gain:
-                        best_gain = new_gain
-                        best_C = C_y
-                        moved_node = True
-                        self.moved_on_level = True
-                
-                self.communities[best_C].add(x)
-                com_tot[best_C] += k[x]
-                self.node_to_com[x] = best_C
-                self.total_gain += best_gain - cost_removal
-                
-                # remove the original community if it is now empty
-                if len(self.communities[C_x]) == 0:
-                    del self.communities[C_x]
-            
-            # exit the loop when all nodes stayed in their community
-            if not moved_node:
-                break
+    
+    def _set_communities(self, com):
+        
+        # communities in the order of their ids' positions in self.nodes
+        position = {x: i for i, x in enumerate(self.nodes)}
+        self.communities = {C: set()
+                            for C in sorted(set(com), key=position.get)}
+        for x in self.nodes:
+            self.communities[com[x]].add(x)
+            self.node_to_com[x] = com[x]
     
     
     def _cluster_by_obj(self):
@@ -410,14 +372,22 @@ class _Level:
             return
         
         # avoid recomputation of the partition in each iteration
-        part = {i: set(x.nodes) for x, i in self.node_to_com.items()}
+        part = {i: set(self.members[x]) for x, i in self.node_to_com.items()}
         
         obj = self.obj_function(self.get_partition(), *self.args)
     
         while True:
             moved_node = False
             
-            for x in self.nodes:
+            # the neighbors of moved nodes are visited again (fast local
+            # move), see '_local_moving'
+            queue = deque(self.nodes)
+            in_queue = set(self.nodes)
+            
+            while queue:
+                
+                x = queue.popleft()
+                in_queue.remove(x)
                 
                 C_x = self.node_to_com[x]
                 
@@ -428,7 +398,7 @@ class _Level:
                 
                 # remove x from its community
                 self.communities[C_x].remove(x)
-                part[C_x].difference_update(x.nodes)
+                part[C_x].difference_update(self.members[x])
                 
                 # C_x is preferred in case of ties, i.e. stays in its original
                 # community
@@ -442,9 +412,9 @@ class _Level:
                     if C_y in visited:
                         continue
                     
-                    part[C_y].update(x.nodes)
+                    part[C_y].update(self.members[x])
                     new_obj = self.obj_function(part.values(), *self.args)
-                    part[C_y].difference_update(x.nodes)
+                    part[C_y].difference_update(self.members[x])
                     
                     new_gain = self._opt_mode * (obj - new_obj)
                     
@@ -455,7 +425,7 @@ class _Level:
                         self.moved_on_level = True
                 
                 self.communities[best_C].add(x)
-                part[best_C].update(x.nodes)
+                part[best_C].update(self.members[x])
                 self.node_to_com[x] = best_C
                 self.total_gain += best_gain
                 obj -= self._opt_mode * best_gain
@@ -464,6 +434,14 @@ class _Level:
                 if len(self.communities[C_x]) == 0:
                     del self.communities[C_x]
                     del part[C_x]
+                
+                # queue the neighbors outside of the new community
+                if best_C != C_x:
+                    for y in self.graph.neighbors(x):
+                        if (y not in in_queue and
+                            self.node_to_com[y] != best_C):
+                            queue.append(y)
+                            in_queue.add(y)
             
             # exit the loop when all nodes stayed in their community
             if not moved_node:
@@ -471,27 +449,233 @@ class _Level:
             
     
     def get_partition(self):
-        """Convert the communities of supernodes into a partition of the 
-        orginal nodes."""
+        """Convert the communities of the nodes of the level into a partition
+        of the orginal nodes."""
         
-        return [set(itertools.chain.from_iterable(com))
+        return [set(itertools.chain.from_iterable(self.members[x]
+                                                  for x in com))
                 for com in self.communities.values()]
+
+
+def _adjacency_arrays(graph, nodes, weight):
+    """Adjacency of an undirected graph as CSR arrays.
     
+    The nodes are identified with their positions in 'nodes'. The neighbors
+    of each node are in the same order as in 'graph.neighbors', a self-loop
+    is contained once. Edges without the attribute 'weight' have weight 1.0.
     
-    def _weight_sums_to_communities(self, x):
+    Returns
+    -------
+    tuple of three numpy.ndarrays
+        The index pointers, the neighbor indices and the edge weights.
+    """
     
-        # sum of the weight from x to every community C ( \{x} )
-        # the community of x must be present even if x is its only element
-        weight_sums = {self.node_to_com[x]: 0.0}
-        
-        for y in self.graph.neighbors(x):
-            if x == y:
+    index = {x: i for i, x in enumerate(nodes)}
+    indptr = np.zeros(len(nodes) + 1, dtype=np.intp)
+    indices, weights = [], []
+    
+    for i, x in enumerate(nodes):
+        for y, data in graph.adj[x].items():
+            indices.append(index[y])
+            weights.append(data.get(weight, 1.0))
+        indptr[i+1] = len(indices)
+    
+    return (indptr, np.array(indices, dtype=np.intp),
+            np.array(weights, dtype=np.float64))
+
+
+def _aggregate(indptr, indices, weights, com, n_com):
+    """Adjacency of the graph of the communities as CSR arrays.
+    
+    The weight of an edge between two communities is the sum of the weights
+    of the edges between their nodes, the weight of a self-loop of a
+    community is the total weight of the edges (and self-loops) within it.
+    Input and output are CSR arrays as returned by '_adjacency_arrays', the
+    neighbors are sorted by their indices.
+    """
+    
+    rows = np.repeat(np.arange(len(com)), np.diff(indptr))
+    C_rows, C_cols = com[rows], com[indices]
+    
+    # edges within a community occur twice (x, y) and (y, x), self-loops once
+    data = weights.copy()
+    data[(C_rows == C_cols) & (rows != indices)] *= 0.5
+    
+    A = coo_matrix((data, (C_rows, C_cols)), shape=(n_com, n_com))
+    A = A.tocsr()
+    A.sum_duplicates()
+    
+    return A.indptr.astype(np.intp), A.indices.astype(np.intp), A.data
+
+
+def _modularity(indptr, indices, weights):
+    """Modularity of the partition into singletons.
+    
+    For the graph of the communities (see '_aggregate'), this is the
+    modularity of the partition of the original graph. The CSR arrays are
+    as returned by '_adjacency_arrays'.
+    """
+    
+    n = len(indptr) - 1
+    rows = np.repeat(np.arange(n), np.diff(indptr))
+    loops = rows == indices
+    
+    # self-loops count twice in the degrees
+    k = (np.bincount(rows, weights=weights, minlength=n) +
+         np.bincount(rows[loops], weights=weights[loops], minlength=n))
+    m = k.sum() / 2
+    
+    return weights[loops].sum() / m - np.sum((k / (2 * m))**2)
+
+
+def _local_moving(indptr, indices, weights, order, com, at_least_two):
+    """Local moving phase of a Louvain level with modularity on CSR arrays.
+    
+    The nodes are visited in the given order and moved into the neighboring
+    community with the largest gain in modularity (the own community is
+    preferred in case of ties). The neighbors of a moved node that are not
+    in its new community are queued to be visited again (fast local move
+    as in the Leiden algorithm). This is repeated until no node moves in a
+    visit of all nodes. The communities 'com' (initially one per node) are
+    modified in place. Returns whether any node was moved and the total
+    gain in modularity.
+    
+    Compiled with Numba if available, the CSR data are then passed as
+    arrays, and as lists otherwise.
+    """
+    
+    n = len(com)
+    
+    # sum of the weights of all edges incident to nodes (self-loops count
+    # twice) and sum of all edge weights
+    k = [0.0] * n
+    for x in range(n):
+        for j in range(indptr[x], indptr[x+1]):
+            k[x] += weights[j]
+            if indices[j] == x:
+                k[x] += weights[j]
+    m = 0.0
+    for x in range(n):
+        m += k[x]
+    m /= 2
+    
+    moved_on_level = False
+    total_gain = 0.0
+    
+    # for an edgeless graph, every node is in its own cluster
+    if m == 0:
+        return moved_on_level, total_gain
+    
+    inv_m = 1.0 / m
+    inv_2m = 0.5 / m
+    
+    # sum of the weights of the links incident to nodes in the community,
+    # community sizes and number of (non-empty) communities
+    com_tot = k.copy()
+    size = [1] * n
+    n_com = n
+    
+    # sums of the weights of the links of x to the communities, only the
+    # entries of the communities of the neighbors are touched and reset
+    k_x_in = [0.0] * n
+    touched = [False] * n
+    
+    # circular queue of the nodes to be visited, every node is contained
+    # at most once
+    queue = [0] * n
+    in_queue = [False] * n
+    
+    while True:
+        moved_node = False
+        
+        for i in range(n):
+            queue[i] = order[i]
+            in_queue[order[i]] = True
+        head, queued = 0, n
+        
+        while queued:
+            
+            x = queue[head]
+            head = (head + 1) % n
+            queued -= 1
+            in_queue[x] = False
+            
+            C_x = com[x]
+            
+            # check if we would merge the last two communities
+            if at_least_two and n_com == 2 and size[C_x] == 1:
                 continue
-            C = self.node_to_com[y]
-            w = self.graph.get_edge_data(x, y).get(self.weight, 1.0)
-            weight_sums[C] = weight_sums.get(C, 0.0) + w
-        
-        return weight_sums
+            
+            # weights of the links of x to elements in C \ {x}
+            for j in range(indptr[x], indptr[x+1]):
+                if indices[j] != x:
+                    C = com[indices[j]]
+                    k_x_in[C] += weights[j]
+                    touched[C] = True
+            
+            # remove x from its community
+            size[C_x] -= 1
+            com_tot[C_x] -= k[x]
+            
+            # C_x is preferred in case of ties, i.e. stays in its original
+            # community
+            
+            # equation in Blondel et al. can be simplified to this, the
+            # factor 1/m does not change the comparisons and is only applied
+            # to the total gain
+            k_x_2m = k[x] * inv_2m
+            cost_removal = k_x_in[C_x] - com_tot[C_x] * k_x_2m
+            best_gain = cost_removal
+            best_C = C_x
+            
+            for j in range(indptr[x], indptr[x+1]):
+                
+                C_y = com[indices[j]]
+                if C_y == C_x:
+                    continue
+                
+                new_gain = k_x_in[C_y] - com_tot[C_y] * k_x_2m
+                
+                if new_gain > best_gain:
+                    best_gain = new_gain
+                    best_C = C_y
+                    moved_node = True
+                    moved_on_level = True
+            
+            size[best_C] += 1
+            com_tot[best_C] += k[x]
+            com[x] = best_C
+            total_gain += (best_gain - cost_removal) * inv_m
+            
+            # the original community is removed if it is now empty
+            if size[C_x] == 0:
+                n_com -= 1
+            
+            # reset the weight sums
+            for j in range(indptr[x], indptr[x+1]):
+                C = com[indices[j]]
+                if touched[C]:
+                    k_x_in[C] = 0.0
+                    touched[C] = False
+            
+            # queue the neighbors outside of the new community
+            if best_C != C_x:
+                for j in range(indptr[x], indptr[x+1]):
+                    y = indices[j]
+                    if not in_queue[y] and com[y] != best_C:
+                        queue[(head + queued) % n] = y
+                        queued += 1
+                        in_queue[y] = True
+            
+        # exit the loop when all nodes stayed in their community
+        if not moved_node:
+            break
+    
+    return moved_on_level, total_gain
+
+
+if njit is not None:
+    _local_moving = njit(cache=True, nogil=True)(_local_moving)
 
 
 if __name__ == '__main__':